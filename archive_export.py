@@ -0,0 +1,178 @@
+# archive_export.py
+# Flattens archived games cached by archives_manager into typed Parquet tables
+#
+# Output is partitioned by player and month:
+#   parquet/player=<player>/month=<yyyy-mm>/games.parquet
+# and parquet/_manifest.json records the cache fetch time each partition was built from,
+# so re-running an export only writes months that are new or were refreshed since.
+#
+# Ratings are exported exactly as cached (chess.com post-game ratings, no elo correction).
+#
+# Usage:
+# archive_export.export_player_archives('hikaru')
+# table = archive_export.read_games_table(columns=['end_time', 'white_rating', 'black_rating'], players=['hikaru'])
+
+import json
+import os
+import pyarrow as pa
+import pyarrow.parquet as pq
+import archive_store
+import archives_manager
+
+
+GAMES_SCHEMA = pa.schema([
+    ('end_time', pa.int64()),
+    ('url', pa.string()),
+    ('uuid', pa.string()),
+    ('white_username', pa.string()),
+    ('black_username', pa.string()),
+    ('white_rating', pa.int32()),
+    ('black_rating', pa.int32()),
+    ('white_result', pa.string()),
+    ('black_result', pa.string()),
+    ('white_accuracy', pa.float64()),
+    ('black_accuracy', pa.float64()),
+    ('time_class', pa.string()),
+    ('rated', pa.bool_()),
+    ('rules', pa.string()),
+    ('time_control', pa.string()),
+    ('pgn', pa.string()),
+])
+
+MANIFEST_FILE = '_manifest.json'
+
+
+def flatten_game(archived_game):
+    """
+    Flatten an archived game dictionary into a row with the GAMES_SCHEMA columns.
+    Accuracies are None for games without accuracies.
+    """
+    accuracies = archived_game.get('accuracies') or {}
+
+    return {
+        'end_time': archived_game['end_time'],
+        'url': archived_game.get('url'),
+        'uuid': archived_game.get('uuid'),
+        'white_username': archived_game['white']['username'],
+        'black_username': archived_game['black']['username'],
+        'white_rating': archived_game['white']['rating'],
+        'black_rating': archived_game['black']['rating'],
+        'white_result': archived_game['white']['result'],
+        'black_result': archived_game['black']['result'],
+        'white_accuracy': accuracies.get('white'),
+        'black_accuracy': accuracies.get('black'),
+        'time_class': archived_game.get('time_class'),
+        'rated': archived_game.get('rated'),
+        'rules': archived_game.get('rules'),
+        'time_control': archived_game.get('time_control'),
+        'pgn': archived_game.get('pgn'),
+    }
+
+def games_to_table(archived_games):
+    """
+    Build a pyarrow Table with the GAMES_SCHEMA columns from a list of archived games.
+    """
+    columns = {field.name: [] for field in GAMES_SCHEMA}
+    for archived_game in archived_games:
+        row = flatten_game(archived_game)
+        for name, column in columns.items():
+            column.append(row[name])
+
+    return pa.Table.from_pydict(columns, schema=GAMES_SCHEMA)
+
+def _partitionPath(out_dir, player_name, year, month):
+    return os.path.join(out_dir, f'player={player_name.lower()}', f'month={year}-{month}', 'games.parquet')
+
+def _readManifest(out_dir):
+    manifest_path = os.path.join(out_dir, MANIFEST_FILE)
+    if not os.path.isfile(manifest_path):
+        return {}
+
+    with open(manifest_path, 'r') as json_file:
+        return json.load(json_file)
+
+def _saveManifest(out_dir, manifest):
+    archive_store.write_file_atomic(os.path.join(out_dir, MANIFEST_FILE), json.dumps(manifest))
+
+def export_player_archives(player_name, out_dir='parquet', verbose=False):
+    """
+    Export every cached month archive of a player to Parquet. Months that were already exported
+    from the same cached copy are skipped, so repeated exports only append new or refreshed months.
+
+    Parameters:
+    - player_name (str): The player's username on chess.com
+    - out_dir (str): Root directory of the partitioned Parquet dataset. Default 'parquet'.
+    - verbose (bool): Print every month written. Default False.
+
+    Returns:
+    - int: The number of month partitions written.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = _readManifest(out_dir)
+    store = archives_manager.store
+
+    num_written = 0
+    for month_player, year, month in store.iter_months(player_name):
+        key = f'{month_player.lower()}/{year}/{month}'
+        fetched_at = store.read_month_meta(month_player, year, month)['fetched_at']
+        partition_path = _partitionPath(out_dir, month_player, year, month)
+
+        if manifest.get(key) == fetched_at and os.path.isfile(partition_path):
+            continue
+
+        if verbose:
+            print(f"Exporting {key}")
+
+        table = games_to_table(store.read_month(month_player, year, month))
+        buffer = pa.BufferOutputStream()
+        pq.write_table(table, buffer)
+        archive_store.write_file_atomic(partition_path, buffer.getvalue().to_pybytes())
+
+        manifest[key] = fetched_at
+        num_written += 1
+
+    if num_written > 0:
+        _saveManifest(out_dir, manifest)
+
+    return num_written
+
+def read_games_table(out_dir='parquet', columns=None, players=None):
+    """
+    Read exported games back as one pyarrow Table, memory mapping the Parquet files and decoding only the requested columns.
+
+    Parameters:
+    - out_dir (str): Root directory of the partitioned Parquet dataset. Default 'parquet'.
+    - columns (list): Column names to read, None reads every column. Default None.
+    - players (list): Usernames to read, None reads every exported player. Default None.
+
+    Returns:
+    - pyarrow.Table: The games ordered by player then month, plus 'player' and 'month' partition columns.
+    """
+    if players is None:
+        player_dirs = sorted(name for name in os.listdir(out_dir) if name.startswith('player='))
+    else:
+        player_dirs = [f'player={player_name.lower()}' for player_name in players]
+
+    schema = GAMES_SCHEMA if columns is None else pa.schema([GAMES_SCHEMA.field(name) for name in columns])
+    schema = schema.append(pa.field('player', pa.string())).append(pa.field('month', pa.string()))
+
+    tables = []
+    for player_dir in player_dirs:
+        player_path = os.path.join(out_dir, player_dir)
+        if not os.path.isdir(player_path):
+            continue
+
+        for month_dir in sorted(os.listdir(player_path)):
+            file_path = os.path.join(player_path, month_dir, 'games.parquet')
+            if not os.path.isfile(file_path):
+                continue
+
+            table = pq.read_table(file_path, columns=columns, memory_map=True)
+            table = table.append_column('player', pa.array([player_dir[len('player='):]] * table.num_rows, pa.string()))
+            table = table.append_column('month', pa.array([month_dir[len('month='):]] * table.num_rows, pa.string()))
+            tables.append(table)
+
+    if len(tables) == 0:
+        return schema.empty_table()
+
+    return pa.concat_tables(tables)
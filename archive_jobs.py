@@ -0,0 +1,166 @@
+# archive_jobs.py
+# Resumable runner for long archives_manager fetch loops, like the opponent lookups of the dataset building notebooks
+#
+# Every completed task's result is written to <job_dir>/results/ (temp file + rename) and then its key is
+# appended to <job_dir>/journal.jsonl. Running the same job again skips the journaled tasks and loads
+# their results from disk, so a build that dies at opponent 1,800 of 2,500 resumes at opponent 1,800.
+# Tasks that raise ArchiveRetrievalError are not journaled and are retried on the next run.
+#
+# Usage:
+# job = archive_jobs.ResumableJob('jobs/october_opponents')
+# tasks = [archive_jobs.window_task(opp_name, end_time - 30 * 24 * 60 * 60, end_time, time_class='rapid',
+#                                   filter_spec={'rated': True, 'exclude_draws': True}, max_games=25) for ...]
+# results = job.run(tasks, archive_jobs.fetch_window, max_workers=4)
+# opp_recent_games = results[job.task_key(tasks[0])]
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import archive_store
+import archives_manager
+
+
+class ResumableJob:
+    """
+    A set of JSON serializable tasks whose results are checkpointed to job_dir as they complete.
+    """
+
+    def __init__(self, job_dir):
+        self.job_dir = job_dir
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._completed = self._read_journal()
+
+    ## journal
+    def _journal_path(self):
+        return os.path.join(self.job_dir, 'journal.jsonl')
+
+    def _result_path(self, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.job_dir, 'results', f'{digest}.json')
+
+    def _read_journal(self):
+        completed = set()
+        if not os.path.isfile(self._journal_path()):
+            return completed
+
+        with open(self._journal_path(), 'r') as journal_file:
+            for line in journal_file:
+                # a crash while appending can leave a partial last line, that task simply runs again
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if os.path.isfile(self._result_path(entry['key'])):
+                    completed.add(entry['key'])
+
+        return completed
+
+    def _record(self, key, result):
+        archive_store.write_file_atomic(self._result_path(key), archive_store.dumps(result))
+
+        with self._lock:
+            with open(self._journal_path(), 'a') as journal_file:
+                journal_file.write(json.dumps({'key': key}) + '\n')
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            self._completed.add(key)
+
+    ## tasks
+    @staticmethod
+    def task_key(task):
+        return json.dumps(task, sort_keys=True)
+
+    def is_done(self, task):
+        return self.task_key(task) in self._completed
+
+    def result(self, task):
+        """
+        Load the checkpointed result of a completed task.
+        """
+        with open(self._result_path(self.task_key(task)), 'rb') as json_file:
+            return archive_store.loads(json_file.read())
+
+    def run(self, tasks, task_func, max_workers=1, verbose=False):
+        """
+        Run every task that is not journaled yet and checkpoint its result.
+
+        Parameters:
+        - tasks (list): JSON serializable task descriptions, e.g. dictionaries from window_task.
+        - task_func (function): Takes a task and returns its JSON serializable result.
+        - max_workers (int): Number of tasks run concurrently. Default 1.
+        - verbose (bool): Print progress. Default False.
+
+        Returns:
+        - dict: task_key(task) -> result for every task that completed in this or an earlier run.
+        Failed tasks are left out and their errors are kept in self.errors.
+        """
+        os.makedirs(self.job_dir, exist_ok=True)
+
+        unique_tasks = {self.task_key(task): task for task in tasks}
+        pending = {key: task for key, task in unique_tasks.items() if key not in self._completed}
+        self.errors = {}
+
+        if verbose:
+            print(f"{len(unique_tasks) - len(pending)} of {len(unique_tasks)} tasks already done")
+
+        results = {}
+
+        def run_task(key, task):
+            result = task_func(task)
+            self._record(key, result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(run_task, key, task): key for key, task in pending.items()}
+            for num_done, future in enumerate(as_completed(futures), 1):
+                key = futures[future]
+                try:
+                    results[key] = future.result()
+                except archives_manager.ArchiveRetrievalError as e:
+                    self.errors[key] = e
+                    print(f"archive retrieval error {key}: {e}")
+
+                if verbose:
+                    print(f"{num_done}/{len(pending)} tasks run")
+
+        for key, task in unique_tasks.items():
+            if key in self._completed and key not in results:
+                results[key] = self.result(task)
+
+        return results
+
+
+## archives_manager tasks
+def window_task(player_name, start_unix, end_unix, time_class='rapid', filter_spec=None, correct_elo=True, max_games=None):
+    """
+    Describe a get_games_between_timestamps call as a task, filter_spec holds build_archive_filter keyword arguments.
+    """
+    return {
+        'player_name': player_name.lower(),
+        'start_unix': start_unix,
+        'end_unix': end_unix,
+        'time_class': time_class,
+        'filter_spec': filter_spec,
+        'correct_elo': correct_elo,
+        'max_games': max_games
+    }
+
+def fetch_window(task):
+    """
+    Run a window_task, returns the list of archived games.
+    """
+    filter_spec = task['filter_spec']
+    archived_games = archives_manager.get_games_between_timestamps(
+        task['player_name'],
+        task['start_unix'],
+        task['end_unix'],
+        time_class=task['time_class'],
+        filter_func=None if filter_spec is None else archives_manager.build_archive_filter(**filter_spec),
+        correct_elo=task['correct_elo'],
+        max_games=task['max_games']
+    )
+
+    return [archived_game.materialize() if isinstance(archived_game, archives_manager.LazyGame) else archived_game for archived_game in archived_games]
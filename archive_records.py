@@ -0,0 +1,232 @@
+# archive_records.py
+# Compact fixed-width records for holding hundreds of thousands of archived games in memory
+#
+# An archived game dictionary with its pgn, fen, tcn and player sub-dicts takes a few kilobytes.
+# to_records packs the fields feature code reads into a numpy structured array of about 60 bytes
+# per game, with usernames as archives_manager player ids and categorical strings as small codes.
+# The pgn goes to a PgnStore and the record keeps its (offset, length).
+#
+# Player ids only hold within the process that assigned them, so records are saved with save_records,
+# which stores the usernames of their ids, and loaded back with load_records, which maps them to this process's ids.
+#
+# Usage:
+# pgn_store = archive_records.PgnStore('opp_games.pgn')
+# records = archive_records.to_records(opp_games, pgn_store)
+# columns = archive_records.record_columns(records, opp_name)
+# pgn = pgn_store.read_record(records[0])
+# archive_records.save_records('opp_games.npz', records)
+
+import os
+import threading
+import numpy as np
+import archives_manager
+
+
+RESULT_CODES = (
+    'win', 'checkmated', 'agreed', 'repetition', 'timeout', 'resigned', 'stalemate', 'lose',
+    'insufficient', '50move', 'abandoned', 'kingofthehill', 'threecheck', 'timevsinsufficient', 'bughousepartnerlose'
+)
+TIME_CLASSES = ('bullet', 'blitz', 'rapid', 'daily')
+RULES = ('chess', 'chess960', 'bughouse', 'kingofthehill', 'threecheck', 'crazyhouse', 'oddschess')
+UNKNOWN_CODE = 255
+
+GAME_RECORD_DTYPE = np.dtype([
+    ('end_time', np.int64),
+    ('white_id', np.int32),
+    ('black_id', np.int32),
+    ('white_rating', np.int16),
+    ('black_rating', np.int16),
+    ('white_result', np.uint8),
+    ('black_result', np.uint8),
+    ('time_class', np.uint8),
+    ('rules', np.uint8),
+    ('rated', np.int8),             # 1, 0, or -1 if missing
+    ('white_accuracy', np.float64), # nan if the game has no accuracies
+    ('black_accuracy', np.float64),
+    ('base_time', np.int32),        # seconds, per move for daily games, -1 if unknown
+    ('increment', np.int16),
+    ('pgn_offset', np.int64),       # -1 if the pgn was not stored
+    ('pgn_length', np.int32),
+])
+
+_result_codes = {result: code for code, result in enumerate(RESULT_CODES)}
+_time_class_codes = {time_class: code for code, time_class in enumerate(TIME_CLASSES)}
+_rules_codes = {rules: code for code, rules in enumerate(RULES)}
+
+
+class PgnStore:
+    """
+    Append-only side store of pgn text referenced by (offset, length), in memory or in a file.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        if path is None:
+            self._buffer = bytearray()
+            self._file = None
+        else:
+            self._buffer = None
+            self._file = open(path, 'a+b')
+
+    def append(self, pgn):
+        data = pgn.encode('utf-8')
+        with self._lock:
+            if self._file is None:
+                offset = len(self._buffer)
+                self._buffer += data
+            else:
+                self._file.seek(0, os.SEEK_END)
+                offset = self._file.tell()
+                self._file.write(data)
+        return offset, len(data)
+
+    def read(self, offset, length):
+        with self._lock:
+            if self._file is None:
+                data = bytes(self._buffer[offset:offset + length])
+            else:
+                self._file.flush()
+                self._file.seek(offset)
+                data = self._file.read(length)
+        return data.decode('utf-8')
+
+    def read_record(self, record):
+        """
+        Get the pgn of a game record, None if it was not stored.
+        """
+        if record['pgn_offset'] < 0:
+            return None
+        return self.read(int(record['pgn_offset']), int(record['pgn_length']))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def to_records(archived_games, pgn_store=None):
+    """
+    Pack archived games into a structured array with GAME_RECORD_DTYPE fields.
+
+    Parameters:
+    - archived_games (list): The archived game dictionaries.
+    - pgn_store (PgnStore): Where to keep the pgns, None drops them. Default None.
+
+    Returns:
+    - numpy.ndarray: One record per game, in the same order.
+    """
+    records = np.empty(len(archived_games), dtype=GAME_RECORD_DTYPE)
+
+    rows = []
+    for archived_game in archived_games:
+        white, black = archived_game['white'], archived_game['black']
+        accuracies = archived_game.get('accuracies') or {}
+        time_control = archives_manager.parse_time_control(archived_game.get('time_control'))
+        rated = archived_game.get('rated')
+
+        pgn_offset, pgn_length = -1, 0
+        if pgn_store is not None and archived_game.get('pgn') is not None:
+            pgn_offset, pgn_length = pgn_store.append(archived_game['pgn'])
+
+        white_accuracy, black_accuracy = accuracies.get('white'), accuracies.get('black')
+
+        rows.append((
+            archived_game['end_time'],
+            archives_manager.player_id(white['username']),
+            archives_manager.player_id(black['username']),
+            white['rating'],
+            black['rating'],
+            _result_codes.get(white.get('result'), UNKNOWN_CODE),
+            _result_codes.get(black.get('result'), UNKNOWN_CODE),
+            _time_class_codes.get(archived_game.get('time_class'), UNKNOWN_CODE),
+            _rules_codes.get(archived_game.get('rules'), UNKNOWN_CODE),
+            -1 if rated is None else int(rated),
+            np.nan if white_accuracy is None else white_accuracy,
+            np.nan if black_accuracy is None else black_accuracy,
+            -1 if time_control is None else time_control[0],
+            0 if time_control is None else time_control[1],
+            pgn_offset,
+            pgn_length
+        ))
+
+    records[:] = rows
+    return records
+
+def record_columns(records, player_name):
+    """
+    The columns of archives_manager.get_game_columns computed from game records, without touching any game dictionary.
+
+    Parameters:
+    - records (numpy.ndarray): Game records from to_records.
+    - player_name (str): The perspective player, who must play in every game.
+
+    Returns:
+    - dict: The same keys as archives_manager.get_game_columns, opponent names are lowercase.
+    """
+    player_idx = archives_manager.player_id(player_name)
+    is_white = records['white_id'] == player_idx
+
+    if not np.all(is_white | (records['black_id'] == player_idx)):
+        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
+
+    white_won = records['white_result'] == _result_codes['win']
+    black_won = records['black_result'] == _result_codes['win']
+    white_elo = records['white_rating'].astype(np.int64)
+    black_elo = records['black_rating'].astype(np.int64)
+    white_accuracy = records['white_accuracy']
+    black_accuracy = records['black_accuracy']
+    opponent_ids = np.where(is_white, records['black_id'], records['white_id'])
+    unique_ids, inverse = np.unique(opponent_ids, return_inverse=True)
+    opponent_names = np.array([archives_manager.player_name_from_id(opponent_id) for opponent_id in unique_ids], dtype=object)
+
+    return {
+        'end_time': records['end_time'].copy(),
+        'is_white': is_white,
+        'player_elo': np.where(is_white, white_elo, black_elo),
+        'opponent_elo': np.where(is_white, black_elo, white_elo),
+        'won': np.where(is_white, white_won, ~white_won & black_won).astype(np.int8),
+        'draw': ~(white_won | black_won),
+        'player_accuracy': np.where(is_white, white_accuracy, black_accuracy),
+        'opponent_accuracy': np.where(is_white, black_accuracy, white_accuracy),
+        'has_accuracies': ~np.isnan(white_accuracy),
+        'opponent_name': opponent_names[inverse]
+    }
+
+def save_records(path, records):
+    """
+    Save game records to a .npz file with the usernames of their player ids, for load_records in any process.
+
+    Parameters:
+    - path (str): Destination file.
+    - records (numpy.ndarray): Game records from to_records.
+    """
+    ids = np.unique(np.concatenate((records['white_id'], records['black_id'])))
+    names = np.array([archives_manager.player_name_from_id(int(player_idx)) for player_idx in ids], dtype=str)
+    with open(path, 'wb') as npz_file:
+        np.savez(npz_file, records=records, player_ids=ids, player_names=names)
+
+def load_records(path):
+    """
+    Load game records saved by save_records, with their player ids mapped to this process's archives_manager player ids.
+
+    Parameters:
+    - path (str): File written by save_records.
+
+    Returns:
+    - numpy.ndarray: The game records.
+    """
+    with np.load(path) as data:
+        records = data['records']
+        ids = data['player_ids']
+        local_ids = np.array([archives_manager.player_id(str(name)) for name in data['player_names']], dtype=np.int32)
+
+    records['white_id'] = local_ids[np.searchsorted(ids, records['white_id'])]
+    records['black_id'] = local_ids[np.searchsorted(ids, records['black_id'])]
+    return records
+
+def decode_result(code):
+    return None if code == UNKNOWN_CODE else RESULT_CODES[code]
+
+def decode_time_class(code):
+    return None if code == UNKNOWN_CODE else TIME_CLASSES[code]
@@ -0,0 +1,735 @@
+# archive_store.py
+# Storage backends for the archives cached by archives_manager
+#
+# JsonArchiveStore keeps the original json/ directory tree:
+#   json/archive_lists/<player>.json
+#   json/archives/<player>/<year>/<month>.json
+#   json/month_index/<player>.json
+# with a <name>.meta.json sidecar holding the HTTP validators of each file.
+#
+# SqliteArchiveStore keeps everything in one database file with games indexed by
+# (player, end_time, time_class, rated), so time window queries are index range scans.
+# A game shows up in the month archives of both of its players, but its body is stored
+# once in game_bodies, keyed by uuid (or url), and each player's month rows point at it.
+#
+# Migrating an existing json/ tree:
+#   python archive_store.py migrate --json-root json --db archives.sqlite3
+#
+# Archives are decoded with orjson when it is installed, which is several times faster
+# than the standard json module on the large month archives. set_json_backend switches back.
+#
+# JsonArchiveStore(compression='zstd') writes month archives as <month>.json.zst, optionally with a
+# dictionary trained on cached games (the pgn headers are very repetitive). Compressed and plain
+# month files are both read transparently. Compressing an existing tree:
+#   python archive_store.py compress --json-root json --train-dictionary
+#
+# Several processes can share one store. Files are written to a temp file, fsync'd and renamed into place,
+# and fetch_lock(key) lets only one process download a given month while the others wait for its result.
+# Locks are striped over a fixed set of lock files, so the lock directory never grows with the cache.
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+## JSON decoding backend
+json_backend = 'orjson' if orjson is not None else 'json'
+
+def set_json_backend(name):
+    """
+    Choose the JSON library used to read and write archives, 'orjson' or 'json'.
+    """
+    global json_backend
+
+    if name == 'orjson' and orjson is None:
+        raise ImportError("The 'orjson' backend needs the orjson package installed.")
+    if name not in ('orjson', 'json'):
+        raise ValueError(f"Unknown json backend '{name}', expected 'orjson' or 'json'.")
+
+    json_backend = name
+
+def loads(data):
+    if json_backend == 'orjson':
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps(obj):
+    if json_backend == 'orjson':
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
+
+
+## Atomic writes and cross-process locks
+# fsync makes the renamed file survive a power loss too, turning it off only keeps the rename guarantee
+fsync_writes = True
+
+def _fsyncDirectory(directory):
+    if not fsync_writes or not hasattr(os, 'O_DIRECTORY'):
+        return
+
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def write_file_atomic(file_path, data):
+    """
+    Write bytes or str to a temporary file in the destination directory and rename it into place,
+    so readers (and a run resumed after a crash) only ever see the old file or the complete new one.
+    """
+    directory = os.path.dirname(file_path) or '.'
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(prefix='.' + os.path.basename(file_path) + '.', suffix='.tmp', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            temp_file.write(data.encode('utf-8') if isinstance(data, str) else data)
+            if fsync_writes:
+                temp_file.flush()
+                os.fsync(temp_file.fileno())
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    _fsyncDirectory(directory)
+
+class FileLock:
+    """
+    Exclusive lock on a lock file, held by one thread of one process at a time.
+    Threads of the same process queue on a shared threading.Lock, processes on flock (POSIX only,
+    elsewhere it only excludes threads of the same process).
+    """
+
+    _thread_locks = {}
+    _thread_locks_lock = threading.Lock()
+
+    def __init__(self, lock_path):
+        self.lock_path = lock_path
+        with FileLock._thread_locks_lock:
+            self._thread_lock = FileLock._thread_locks.setdefault(lock_path, threading.Lock())
+        self._file = None
+
+    def __enter__(self):
+        self._thread_lock.acquire()
+        try:
+            if fcntl is not None:
+                os.makedirs(os.path.dirname(self.lock_path) or '.', exist_ok=True)
+                self._file = open(self.lock_path, 'a')
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        except BaseException:
+            self._release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._release()
+
+    def _release(self):
+        if self._file is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._thread_lock.release()
+
+# lock files per kind of key, keys of one kind that hash to the same stripe share a lock
+LOCK_STRIPES = 64
+
+def _lockFileName(key):
+    # 'hikaru/2023/10' is a month, 'hikaru/archives' and 'hikaru/month_index' name their own kind. Kinds never
+    # share stripes, so the month index lock taken while holding a month lock can not be that same lock.
+    key = key.lower()
+    kind = key.rsplit('/', 1)[-1]
+    if kind.isdigit():
+        kind = 'month'
+    stripe = zlib.crc32(key.encode('utf-8')) % LOCK_STRIPES
+    return f'{kind}-{stripe:02d}.lock'
+
+
+class JsonArchiveStore:
+    supports_queries = False
+
+    ZSTD_SUFFIX = '.zst'
+
+    def __init__(self, root='json', compression=None, compression_level=3):
+        if compression not in (None, 'zstd'):
+            raise ValueError(f"Unknown compression '{compression}', expected None or 'zstd'.")
+        if compression == 'zstd' and zstandard is None:
+            raise ImportError("zstd compression needs the zstandard package installed.")
+
+        self.root = root
+        self.compression = compression
+        self.compression_level = compression_level
+        self._dictionaries = {}
+        self._dictionaries_lock = threading.Lock()
+
+    def initialize(self):
+        os.makedirs(os.path.join(self.root, 'archive_lists'), exist_ok=True)
+        os.makedirs(os.path.join(self.root, 'archives'), exist_ok=True)
+
+    def fetch_lock(self, key):
+        """
+        Lock held while downloading the resource named by key, e.g. 'hikaru/2023/10'.
+        """
+        return FileLock(os.path.join(self.root, 'locks', _lockFileName(key)))
+
+    ## file paths
+    def archives_list_path(self, player_name):
+        return os.path.join(self.root, 'archive_lists', f'{player_name.lower()}.json')
+
+    def month_index_path(self, player_name):
+        return os.path.join(self.root, 'month_index', f'{player_name.lower()}.json')
+
+    def month_path(self, player_name, year, month):
+        # archive urls, and so the directories written from them, use lowercase usernames
+        return os.path.join(self.root, 'archives', player_name.lower(), year, f'{month}.json')
+
+    @staticmethod
+    def _meta_path(data_file_path):
+        return data_file_path[:-len('.json')] + '.meta.json'
+
+    def _read_json(self, file_path):
+        with open(file_path, 'rb') as json_file:
+            return loads(json_file.read())
+
+    def _write_json(self, file_path, data):
+        write_file_atomic(file_path, dumps(data))
+
+    def _read_meta(self, data_file_path, modified_path=None):
+        """
+        Files cached before validators were stored get their modification time as the fetch time and no validators.
+        """
+        meta_path = self._meta_path(data_file_path)
+        if os.path.isfile(meta_path):
+            return self._read_json(meta_path)
+
+        return {
+            'etag': None,
+            'last_modified': None,
+            'fetched_at': os.path.getmtime(modified_path or data_file_path)
+        }
+
+    ## zstd compression
+    def _dictionaries_dir(self):
+        return os.path.join(self.root, 'zstd_dicts')
+
+    def _dictionary(self, dict_id):
+        # dictionaries are stored by id, so files compressed with an older dictionary stay readable after retraining
+        with self._dictionaries_lock:
+            if dict_id not in self._dictionaries:
+                with open(os.path.join(self._dictionaries_dir(), f'{dict_id}.dict'), 'rb') as dict_file:
+                    self._dictionaries[dict_id] = zstandard.ZstdCompressionDict(dict_file.read())
+            return self._dictionaries[dict_id]
+
+    def _current_dictionary(self):
+        current_path = os.path.join(self._dictionaries_dir(), 'current')
+        if not os.path.isfile(current_path):
+            return None
+
+        with open(current_path, 'r') as current_file:
+            return self._dictionary(int(current_file.read().strip()))
+
+    def _compress(self, data):
+        dictionary = self._current_dictionary()
+        if dictionary is None:
+            compressor = zstandard.ZstdCompressor(level=self.compression_level)
+        else:
+            compressor = zstandard.ZstdCompressor(level=self.compression_level, dict_data=dictionary)
+        return compressor.compress(data)
+
+    def _decompress(self, data):
+        if zstandard is None:
+            raise ImportError("Reading zstd compressed archives needs the zstandard package installed.")
+
+        dict_id = zstandard.get_frame_parameters(data).dict_id
+        if dict_id == 0:
+            return zstandard.ZstdDecompressor().decompress(data)
+        return zstandard.ZstdDecompressor(dict_data=self._dictionary(dict_id)).decompress(data)
+
+    def train_zstd_dictionary(self, dict_size=112640, max_months=500):
+        """
+        Train a zstd dictionary on cached games and use it for every month archive written from now on.
+
+        Parameters:
+        - dict_size (int): Dictionary size in bytes. Default 110 KB.
+        - max_months (int): Maximum number of cached month archives to sample games from. Default 500.
+
+        Returns:
+        - int: The id of the new dictionary.
+        """
+        samples = []
+        for i, (player_name, year, month) in enumerate(self.iter_months()):
+            if i == max_months:
+                break
+            samples.extend(dumps(game).encode('utf-8') for game in self.read_month(player_name, year, month))
+
+        dictionary = zstandard.train_dictionary(dict_size, samples)
+        dict_id = dictionary.dict_id()
+
+        os.makedirs(self._dictionaries_dir(), exist_ok=True)
+        with open(os.path.join(self._dictionaries_dir(), f'{dict_id}.dict'), 'wb') as dict_file:
+            dict_file.write(dictionary.as_bytes())
+        with open(os.path.join(self._dictionaries_dir(), 'current'), 'w') as current_file:
+            current_file.write(str(dict_id))
+
+        return dict_id
+
+    ## archive lists
+    def has_archives_list(self, player_name):
+        return os.path.isfile(self.archives_list_path(player_name))
+
+    def read_archives_list(self, player_name):
+        return self._read_json(self.archives_list_path(player_name))
+
+    def save_archives_list(self, player_name, list_data):
+        self._write_json(self.archives_list_path(player_name), list_data)
+
+    def read_archives_list_meta(self, player_name):
+        return self._read_meta(self.archives_list_path(player_name))
+
+    def save_archives_list_meta(self, player_name, meta):
+        self._write_json(self._meta_path(self.archives_list_path(player_name)), meta)
+
+    ## month archives
+    def _existing_month_path(self, player_name, year, month):
+        file_path = self.month_path(player_name, year, month)
+        if os.path.isfile(file_path + self.ZSTD_SUFFIX):
+            return file_path + self.ZSTD_SUFFIX
+        return file_path
+
+    def has_month(self, player_name, year, month):
+        file_path = self.month_path(player_name, year, month)
+        return os.path.isfile(file_path + self.ZSTD_SUFFIX) or os.path.isfile(file_path)
+
+    def read_month(self, player_name, year, month):
+        file_path = self._existing_month_path(player_name, year, month)
+        if not file_path.endswith(self.ZSTD_SUFFIX):
+            return self._read_json(file_path)
+
+        with open(file_path, 'rb') as zstd_file:
+            return loads(self._decompress(zstd_file.read()))
+
+    def save_month(self, player_name, year, month, games):
+        file_path = self.month_path(player_name, year, month)
+
+        # only one of the plain and compressed files is kept, so a stale copy can never shadow a new one
+        if self.compression == 'zstd':
+            write_file_atomic(file_path + self.ZSTD_SUFFIX, self._compress(dumps(games).encode('utf-8')))
+            stale_path = file_path
+        else:
+            self._write_json(file_path, games)
+            stale_path = file_path + self.ZSTD_SUFFIX
+
+        if os.path.isfile(stale_path):
+            os.remove(stale_path)
+
+    def read_month_meta(self, player_name, year, month):
+        return self._read_meta(self.month_path(player_name, year, month), self._existing_month_path(player_name, year, month))
+
+    def save_month_meta(self, player_name, year, month, meta):
+        self._write_json(self._meta_path(self.month_path(player_name, year, month)), meta)
+
+    ## month index
+    def read_month_index(self, player_name):
+        file_path = self.month_index_path(player_name)
+        if not os.path.isfile(file_path):
+            return None
+        return self._read_json(file_path)
+
+    def save_month_index(self, player_name, month_index):
+        self._write_json(self.month_index_path(player_name), month_index)
+
+    def iter_months(self, player_name=None):
+        """
+        Yield (player_name, year, month) for every cached month archive, or only those of one player.
+        """
+        archives_root = os.path.join(self.root, 'archives')
+        if not os.path.isdir(archives_root):
+            return
+
+        player_names = sorted(os.listdir(archives_root)) if player_name is None else [player_name.lower()]
+        for player_name in player_names:
+            player_dir = os.path.join(archives_root, player_name)
+            if not os.path.isdir(player_dir):
+                continue
+            for year in sorted(os.listdir(player_dir)):
+                year_dir = os.path.join(player_dir, year)
+                if not os.path.isdir(year_dir):
+                    continue
+                months = set()
+                for file_name in os.listdir(year_dir):
+                    if file_name.endswith(self.ZSTD_SUFFIX):
+                        file_name = file_name[:-len(self.ZSTD_SUFFIX)]
+                    if file_name.endswith('.json') and not file_name.endswith('.meta.json'):
+                        months.add(file_name[:-len('.json')])
+
+                for month in sorted(months):
+                    yield player_name, year, month
+
+    def iter_archives_lists(self):
+        """
+        Yield the player name of every cached archives list.
+        """
+        lists_root = os.path.join(self.root, 'archive_lists')
+        if not os.path.isdir(lists_root):
+            return
+
+        for file_name in sorted(os.listdir(lists_root)):
+            if file_name.endswith('.json') and not file_name.endswith('.meta.json'):
+                yield file_name[:-len('.json')]
+
+
+class SqliteArchiveStore:
+    supports_queries = True
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS archive_lists (
+        player TEXT PRIMARY KEY,
+        archives TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        fetched_at REAL
+    );
+    CREATE TABLE IF NOT EXISTS months (
+        player TEXT NOT NULL,
+        year TEXT NOT NULL,
+        month TEXT NOT NULL,
+        etag TEXT,
+        last_modified TEXT,
+        fetched_at REAL,
+        immutable INTEGER,
+        PRIMARY KEY (player, year, month)
+    );
+    CREATE TABLE IF NOT EXISTS games (
+        player TEXT NOT NULL,
+        year TEXT NOT NULL,
+        month TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        end_time INTEGER NOT NULL,
+        time_class TEXT,
+        rated INTEGER,
+        game_id TEXT NOT NULL,
+        PRIMARY KEY (player, year, month, idx)
+    );
+    CREATE INDEX IF NOT EXISTS games_window ON games (player, end_time, time_class, rated);
+    CREATE TABLE IF NOT EXISTS game_bodies (
+        game_id TEXT PRIMARY KEY,
+        game TEXT NOT NULL
+    );
+    CREATE TABLE IF NOT EXISTS month_index (
+        player TEXT PRIMARY KEY,
+        entries TEXT NOT NULL
+    );
+    """
+
+    def __init__(self, db_path='archives.sqlite3'):
+        self.db_path = db_path
+        self._local = threading.local()
+
+    def initialize(self):
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self._connection().executescript(self._SCHEMA)
+
+    def fetch_lock(self, key):
+        """
+        Lock held while downloading the resource named by key, e.g. 'hikaru/2023/10'.
+        """
+        return FileLock(os.path.join(self.db_path + '.locks', _lockFileName(key)))
+
+    def _connection(self):
+        # sqlite connections can not be shared between threads, so every prefetch worker gets its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.db_path, timeout=60)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def game_id(archived_game):
+        return archived_game.get('uuid') or archived_game['url']
+
+    @staticmethod
+    def _meta_from_row(row):
+        return {
+            'etag': row[0],
+            'last_modified': row[1],
+            'fetched_at': row[2]
+        }
+
+    ## archive lists
+    def has_archives_list(self, player_name):
+        row = self._connection().execute('SELECT 1 FROM archive_lists WHERE player = ?', (player_name.lower(),)).fetchone()
+        return row is not None
+
+    def read_archives_list(self, player_name):
+        row = self._connection().execute('SELECT archives FROM archive_lists WHERE player = ?', (player_name.lower(),)).fetchone()
+        return loads(row[0])
+
+    def save_archives_list(self, player_name, list_data):
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT INTO archive_lists (player, archives) VALUES (?, ?) '
+                'ON CONFLICT (player) DO UPDATE SET archives = excluded.archives',
+                (player_name.lower(), dumps(list_data))
+            )
+
+    def read_archives_list_meta(self, player_name):
+        row = self._connection().execute(
+            'SELECT etag, last_modified, fetched_at FROM archive_lists WHERE player = ?', (player_name.lower(),)
+        ).fetchone()
+        meta = self._meta_from_row(row)
+        if meta['fetched_at'] is None:
+            meta['fetched_at'] = 0
+        return meta
+
+    def save_archives_list_meta(self, player_name, meta):
+        with self._connection() as connection:
+            connection.execute(
+                'UPDATE archive_lists SET etag = ?, last_modified = ?, fetched_at = ? WHERE player = ?',
+                (meta.get('etag'), meta.get('last_modified'), meta['fetched_at'], player_name.lower())
+            )
+
+    ## month archives
+    def has_month(self, player_name, year, month):
+        row = self._connection().execute(
+            'SELECT 1 FROM months WHERE player = ? AND year = ? AND month = ?', (player_name.lower(), year, month)
+        ).fetchone()
+        return row is not None
+
+    def read_month(self, player_name, year, month):
+        rows = self._connection().execute(
+            'SELECT game_bodies.game FROM games JOIN game_bodies USING (game_id) '
+            'WHERE player = ? AND year = ? AND month = ? ORDER BY idx',
+            (player_name.lower(), year, month)
+        ).fetchall()
+        return [loads(row[0]) for row in rows]
+
+    def save_month(self, player_name, year, month, games):
+        player = player_name.lower()
+        rows = [
+            (player, year, month, idx, game['end_time'], game.get('time_class'), game.get('rated'), self.game_id(game))
+            for idx, game in enumerate(games)
+        ]
+        bodies = [(self.game_id(game), dumps(game)) for game in games]
+
+        with self._connection() as connection:
+            connection.execute('DELETE FROM games WHERE player = ? AND year = ? AND month = ?', (player, year, month))
+            connection.executemany('INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+            connection.executemany(
+                'INSERT INTO game_bodies VALUES (?, ?) ON CONFLICT (game_id) DO UPDATE SET game = excluded.game', bodies
+            )
+            connection.execute(
+                'INSERT INTO months (player, year, month, fetched_at) VALUES (?, ?, ?, 0) '
+                'ON CONFLICT (player, year, month) DO NOTHING',
+                (player, year, month)
+            )
+
+    def read_month_meta(self, player_name, year, month):
+        row = self._connection().execute(
+            'SELECT etag, last_modified, fetched_at, immutable FROM months WHERE player = ? AND year = ? AND month = ?',
+            (player_name.lower(), year, month)
+        ).fetchone()
+        meta = self._meta_from_row(row)
+        if row[3] is not None:
+            meta['immutable'] = bool(row[3])
+        return meta
+
+    def save_month_meta(self, player_name, year, month, meta):
+        immutable = meta.get('immutable')
+        with self._connection() as connection:
+            connection.execute(
+                'UPDATE months SET etag = ?, last_modified = ?, fetched_at = ?, immutable = ? '
+                'WHERE player = ? AND year = ? AND month = ?',
+                (meta.get('etag'), meta.get('last_modified'), meta['fetched_at'],
+                 None if immutable is None else int(immutable), player_name.lower(), year, month)
+            )
+
+    def iter_months(self, player_name=None):
+        if player_name is None:
+            rows = self._connection().execute('SELECT player, year, month FROM months ORDER BY player, year, month').fetchall()
+        else:
+            rows = self._connection().execute(
+                'SELECT player, year, month FROM months WHERE player = ? ORDER BY year, month', (player_name.lower(),)
+            ).fetchall()
+        for row in rows:
+            yield row
+
+    def iter_archives_lists(self):
+        rows = self._connection().execute('SELECT player FROM archive_lists ORDER BY player').fetchall()
+        for row in rows:
+            yield row[0]
+
+    ## month index
+    def read_month_index(self, player_name):
+        row = self._connection().execute('SELECT entries FROM month_index WHERE player = ?', (player_name.lower(),)).fetchone()
+        if row is None:
+            return None
+        return loads(row[0])
+
+    def save_month_index(self, player_name, month_index):
+        with self._connection() as connection:
+            connection.execute(
+                'INSERT INTO month_index VALUES (?, ?) ON CONFLICT (player) DO UPDATE SET entries = excluded.entries',
+                (player_name.lower(), dumps(month_index))
+            )
+
+    def storage_stats(self):
+        """
+        Returns the number of per-player game entries and of distinct game bodies they point at.
+        """
+        connection = self._connection()
+        return {
+            'game_entries': connection.execute('SELECT COUNT(*) FROM games').fetchone()[0],
+            'game_bodies': connection.execute('SELECT COUNT(*) FROM game_bodies').fetchone()[0]
+        }
+
+    ## queries
+    def query_games(self, player_name, start_unix, end_unix, time_class=None, rated=None, newest_first=True, predicate=None):
+        """
+        Yield a player's cached games with start_unix <= end_time <= end_unix as an index range scan.
+        Games come in month archive order, as reading the month archives one after the other would return them.
+        predicate is an extra (sql, params) condition over the games and game_bodies columns, e.g. from ArchiveFilter.sql_predicate.
+        """
+        sql = 'SELECT game_bodies.game FROM games JOIN game_bodies USING (game_id) WHERE player = ? AND end_time BETWEEN ? AND ?'
+        params = [player_name.lower(), start_unix, end_unix]
+
+        if time_class is not None:
+            sql += ' AND time_class = ?'
+            params.append(time_class)
+        if rated is not None:
+            sql += ' AND rated = ?'
+            params.append(int(rated))
+        if predicate is not None and predicate[0]:
+            sql += f' AND ({predicate[0]})'
+            params.extend(predicate[1])
+
+        order = 'DESC' if newest_first else 'ASC'
+        sql += f' ORDER BY year {order}, month {order}, idx {order}'
+
+        for row in self._connection().execute(sql, params):
+            yield loads(row[0])
+
+
+def migrate_json_tree(json_root='json', db_path='archives.sqlite3', verbose=False):
+    """
+    Import an existing json/ archive tree, validators included, into a SqliteArchiveStore.
+
+    Parameters:
+    - json_root (str): Root directory of the json tree. Default 'json'.
+    - db_path (str): Path of the sqlite database to create or update. Default 'archives.sqlite3'.
+    - verbose (bool): Print every imported file. Default False.
+
+    Returns:
+    - dict: {
+        'archive_lists': Number of archive lists imported.
+        'months': Number of month archives imported.
+    }
+    """
+    source = JsonArchiveStore(json_root)
+    destination = SqliteArchiveStore(db_path)
+    destination.initialize()
+
+    num_lists = 0
+    for player_name in source.iter_archives_lists():
+        destination.save_archives_list(player_name, source.read_archives_list(player_name))
+        destination.save_archives_list_meta(player_name, source.read_archives_list_meta(player_name))
+        num_lists += 1
+
+    num_months = 0
+    for player_name, year, month in source.iter_months():
+        if verbose:
+            print(f"Importing {player_name} {year}/{month}")
+        destination.save_month(player_name, year, month, source.read_month(player_name, year, month))
+        destination.save_month_meta(player_name, year, month, source.read_month_meta(player_name, year, month))
+        num_months += 1
+
+    return {
+        'archive_lists': num_lists,
+        'months': num_months
+    }
+
+
+def compress_json_tree(json_root='json', compression_level=3, train_dictionary=False, verbose=False):
+    """
+    Rewrite every plain month archive of a json/ tree as zstd, keeping its validators.
+
+    Parameters:
+    - json_root (str): Root directory of the json tree. Default 'json'.
+    - compression_level (int): zstd compression level. Default 3.
+    - train_dictionary (bool): Train a dictionary on the cached games first and compress with it. Default False.
+    - verbose (bool): Print every compressed file. Default False.
+
+    Returns:
+    - int: The number of month archives compressed.
+    """
+    store = JsonArchiveStore(json_root, compression='zstd', compression_level=compression_level)
+    if train_dictionary:
+        store.train_zstd_dictionary()
+
+    num_compressed = 0
+    for player_name, year, month in store.iter_months():
+        file_path = store.month_path(player_name, year, month)
+        if not os.path.isfile(file_path):
+            continue
+
+        if verbose:
+            print(f"Compressing {file_path}")
+
+        # legacy files take their fetch time from the file, which is about to be replaced
+        if not os.path.isfile(store._meta_path(file_path)):
+            store.save_month_meta(player_name, year, month, store.read_month_meta(player_name, year, month))
+
+        store.save_month(player_name, year, month, store.read_month(player_name, year, month))
+        num_compressed += 1
+
+    return num_compressed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the archives_manager cache.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='import a json/ archive tree into a sqlite database')
+    migrate_parser.add_argument('--json-root', default='json')
+    migrate_parser.add_argument('--db', default='archives.sqlite3')
+    migrate_parser.add_argument('--verbose', action='store_true')
+
+    compress_parser = subparsers.add_parser('compress', help='rewrite the month archives of a json/ tree with zstd')
+    compress_parser.add_argument('--json-root', default='json')
+    compress_parser.add_argument('--level', type=int, default=3)
+    compress_parser.add_argument('--train-dictionary', action='store_true')
+    compress_parser.add_argument('--verbose', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.command == 'migrate':
+        counts = migrate_json_tree(args.json_root, args.db, verbose=args.verbose)
+        print(f"Imported {counts['archive_lists']} archive lists and {counts['months']} month archives into {args.db}")
+    elif args.command == 'compress':
+        num_compressed = compress_json_tree(args.json_root, args.level, args.train_dictionary, verbose=args.verbose)
+        print(f"Compressed {num_compressed} month archives in {args.json_root}")
@@ -0,0 +1,298 @@
+# archive_sync.py
+# Keeps the cached archives of a watchlist of players up to date and records new games in a change feed
+#
+# Every poll only revalidates the months from each player's high-water mark (the end_time of the newest
+# game seen) up to the current month, usually just the current month, with conditional requests.
+# Games newer than the high-water mark are appended to the change feed, so feature builds can
+# process deltas with get_changes(cursor) instead of rescanning full histories.
+#
+# Usage:
+#   python archive_sync.py add hikaru magnuscarlsen
+#   python archive_sync.py run --interval 300 --workers 4
+#   python archive_sync.py changes --cursor 0
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import archive_store
+import archives_manager
+
+
+def _gameId(archived_game):
+    return archived_game.get('uuid') or archived_game['url']
+
+
+class ArchiveSync:
+    """
+    Watchlist, high-water marks and change feed, stored in state_dir:
+    - state.json: {'watchlist': [...], 'high_water': {player: end_time}, 'high_water_ids': {player: [game_id, ...]}, 'next_seq': int}
+      high_water_ids holds the games ending exactly at the high-water mark, so a later game with the same end_time is not missed
+    - changes.jsonl: one {'seq', 'player', 'year', 'month', 'end_time', 'game_id'} entry per new game
+
+    The feed is appended and fsync'd before the state is saved. If a run dies in between, the next one
+    replays the feed entries the state does not know about into next_seq and the high-water marks.
+    """
+
+    def __init__(self, state_dir=os.path.join('json', 'sync')):
+        self.state_dir = state_dir
+        self._lock = threading.Lock()
+        self.errors = []
+        self.num_errors = 0
+        self.state = self._read_state()
+        self._reconcile_with_feed()
+
+    ## state
+    def _state_path(self):
+        return os.path.join(self.state_dir, 'state.json')
+
+    def _feed_path(self):
+        return os.path.join(self.state_dir, 'changes.jsonl')
+
+    def _read_state(self):
+        if not os.path.isfile(self._state_path()):
+            return {'watchlist': [], 'high_water': {}, 'high_water_ids': {}, 'next_seq': 1}
+
+        with open(self._state_path(), 'r') as json_file:
+            return json.load(json_file)
+
+    def _save_state(self):
+        archive_store.write_file_atomic(self._state_path(), json.dumps(self.state))
+
+    def _reconcile_with_feed(self):
+        """
+        Drop a partial last feed line left by a crash, and apply the feed entries written after the state was last saved.
+        """
+        if not os.path.isfile(self._feed_path()):
+            return
+
+        with open(self._feed_path(), 'rb') as feed_file:
+            data = feed_file.read()
+        if data and not data.endswith(b'\n'):
+            with open(self._feed_path(), 'r+b') as feed_file:
+                feed_file.truncate(data.rfind(b'\n') + 1)
+
+        unsaved_entries = [entry for entry in self._read_feed() if entry['seq'] >= self.state['next_seq']]
+        for entry in unsaved_entries:
+            player_name, end_time = entry['player'], entry['end_time']
+            high_water = self.state['high_water'].get(player_name)
+            if high_water is None or end_time > high_water:
+                self.state['high_water'][player_name] = end_time
+                self.state['high_water_ids'][player_name] = [entry['game_id']]
+            elif end_time == high_water and entry['game_id'] not in self.state['high_water_ids'].get(player_name, []):
+                self.state['high_water_ids'].setdefault(player_name, []).append(entry['game_id'])
+            self.state['next_seq'] = entry['seq'] + 1
+
+        if unsaved_entries:
+            self._save_state()
+
+    def _read_feed(self):
+        if not os.path.isfile(self._feed_path()):
+            return
+        with open(self._feed_path(), 'r') as feed_file:
+            for line in feed_file:
+                # a crash while appending can leave a partial last line
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+
+    ## watchlist
+    def add_players(self, player_names):
+        with self._lock:
+            for player_name in player_names:
+                if player_name.lower() not in self.state['watchlist']:
+                    self.state['watchlist'].append(player_name.lower())
+            self._save_state()
+
+    def remove_players(self, player_names):
+        with self._lock:
+            removed = set(player_name.lower() for player_name in player_names)
+            self.state['watchlist'] = [player_name for player_name in self.state['watchlist'] if player_name not in removed]
+            self._save_state()
+
+    ## polling
+    @staticmethod
+    def _months_to_poll(high_water, now):
+        """
+        (year, month) pairs from the month of the high-water mark through the current month, oldest first.
+        A player without a high-water mark only has the current month polled.
+        """
+        current = time.gmtime(now)
+        if high_water is None:
+            return [(current.tm_year, current.tm_mon)]
+
+        start = time.gmtime(high_water)
+        year, month = start.tm_year, start.tm_mon
+
+        months = []
+        while (year, month) <= (current.tm_year, current.tm_mon):
+            months.append((year, month))
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+        return months
+
+    def _poll_player(self, player_name, now):
+        """
+        Returns (new games, failure), failure is (player, year, month, error) for a month that could not be synced, else None.
+        Months after a failed one are left for the next poll, so the high-water mark never skips the failed month's games.
+        """
+        with self._lock:
+            high_water = self.state['high_water'].get(player_name)
+            high_water_ids = set(self.state['high_water_ids'].get(player_name, []))
+
+        new_games = []
+        for year, month in self._months_to_poll(high_water, now):
+            year, month = f'{year}', f'{month:02d}'
+            try:
+                archived_games, _ = archives_manager.sync_month(player_name, year, month)
+            except archives_manager.ArchiveRetrievalError as e:
+                return new_games, (player_name, year, month, e)
+
+            for archived_game in archived_games:
+                end_time = archived_game['end_time']
+                if high_water is None or end_time > high_water or (end_time == high_water and _gameId(archived_game) not in high_water_ids):
+                    new_games.append((year, month, archived_game))
+
+        return new_games, None
+
+    def _record_new_games(self, player_name, new_games):
+        # callers hold self._lock
+        if not new_games:
+            return
+
+        new_games.sort(key=lambda new_game: new_game[2]['end_time'])
+
+        os.makedirs(self.state_dir, exist_ok=True)
+        with open(self._feed_path(), 'a') as feed_file:
+            for year, month, archived_game in new_games:
+                entry = {
+                    'seq': self.state['next_seq'],
+                    'player': player_name,
+                    'year': year,
+                    'month': month,
+                    'end_time': archived_game['end_time'],
+                    'game_id': _gameId(archived_game)
+                }
+                feed_file.write(json.dumps(entry) + '\n')
+                self.state['next_seq'] += 1
+            feed_file.flush()
+            os.fsync(feed_file.fileno())
+
+        newest_end_time = new_games[-1][2]['end_time']
+        newest_ids = [_gameId(archived_game) for _, _, archived_game in new_games if archived_game['end_time'] == newest_end_time]
+
+        if self.state['high_water'].get(player_name) == newest_end_time:
+            newest_ids += self.state['high_water_ids'].get(player_name, [])
+
+        self.state['high_water'][player_name] = newest_end_time
+        self.state['high_water_ids'][player_name] = newest_ids
+        self._save_state()
+
+    def poll_once(self, max_workers=4):
+        """
+        Poll every player on the watchlist once, with at most max_workers requests in flight.
+        All requests go through the archives_manager rate limiter.
+
+        Returns:
+        - int: The number of new games added to the change feed.
+        Months that could not be synced are kept in self.errors as (player, year, month, error) tuples
+        and counted in self.num_errors over every poll.
+        """
+        now = time.time()
+        with self._lock:
+            watchlist = list(self.state['watchlist'])
+
+        def poll(player_name):
+            new_games, failure = self._poll_player(player_name, now)
+            with self._lock:
+                self._record_new_games(player_name, new_games)
+            return len(new_games), failure
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            polled = list(executor.map(poll, watchlist))
+
+        self.errors = [failure for _, failure in polled if failure is not None]
+        self.num_errors += len(self.errors)
+        return sum(num_new_games for num_new_games, _ in polled)
+
+    def run(self, interval=300, max_workers=4, max_polls=None, verbose=True):
+        """
+        Poll the watchlist every interval seconds, forever or max_polls times.
+        """
+        num_polls = 0
+        while max_polls is None or num_polls < max_polls:
+            started = time.time()
+            num_new_games = self.poll_once(max_workers=max_workers)
+            num_polls += 1
+
+            if verbose:
+                print(f"{time.strftime('%Y-%m-%d %H:%M:%S')} polled {len(self.state['watchlist'])} players, {num_new_games} new games, {len(self.errors)} failed")
+                for player_name, year, month, error in self.errors:
+                    print(f"Failed to sync {player_name} {year}/{month}: {error}")
+
+            if max_polls is None or num_polls < max_polls:
+                time.sleep(max(0, interval - (time.time() - started)))
+
+    ## change feed
+    def get_changes(self, cursor=0, limit=None):
+        """
+        Read the change feed entries after a cursor.
+
+        Parameters:
+        - cursor (int): The last seq already processed, 0 reads the feed from the start. Default 0.
+        - limit (int): Maximum number of entries to return, None returns all of them. Default None.
+
+        Returns:
+        - tuple: (entries, cursor) where cursor is the seq to pass on the next call.
+        """
+        entries = []
+        for entry in self._read_feed():
+            if entry['seq'] <= cursor:
+                continue
+            entries.append(entry)
+            if limit is not None and len(entries) == limit:
+                break
+
+        new_cursor = entries[-1]['seq'] if entries else cursor
+        return entries, new_cursor
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Keep the archives of a watchlist of players up to date.')
+    parser.add_argument('--state-dir', default=os.path.join('json', 'sync'))
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    add_parser = subparsers.add_parser('add', help='add players to the watchlist')
+    add_parser.add_argument('players', nargs='+')
+
+    remove_parser = subparsers.add_parser('remove', help='remove players from the watchlist')
+    remove_parser.add_argument('players', nargs='+')
+
+    run_parser = subparsers.add_parser('run', help='poll the watchlist on a schedule')
+    run_parser.add_argument('--interval', type=float, default=300)
+    run_parser.add_argument('--workers', type=int, default=4)
+    run_parser.add_argument('--once', action='store_true')
+
+    changes_parser = subparsers.add_parser('changes', help='print change feed entries after a cursor')
+    changes_parser.add_argument('--cursor', type=int, default=0)
+    changes_parser.add_argument('--limit', type=int, default=None)
+
+    args = parser.parse_args()
+    sync = ArchiveSync(args.state_dir)
+
+    if args.command == 'add':
+        sync.add_players(args.players)
+    elif args.command == 'remove':
+        sync.remove_players(args.players)
+    elif args.command == 'run':
+        sync.run(interval=args.interval, max_workers=args.workers, max_polls=1 if args.once else None)
+        if args.once and sync.errors:
+            sys.exit(1)
+    elif args.command == 'changes':
+        entries, cursor = sync.get_changes(args.cursor, args.limit)
+        for entry in entries:
+            print(json.dumps(entry))
+        print(f"cursor: {cursor}")
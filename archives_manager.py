@@ -4,26 +4,244 @@
 
 import json
 import os
+import importlib.util
 import requests
+import requests.adapters
 import re
 import time
-import chess
 import datetime
+import calendar
+import archive_store
+import threading
+import bisect
+import functools
+import sys
+import numpy as np
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+
+## Archive storage
+# nothing touches the disk until the cache is first read or written
+store = archive_store.JsonArchiveStore('json')
+
+def set_archive_store(archive_store_backend):
+    """
+    Replace the backend archives are cached in, e.g. archive_store.SqliteArchiveStore('archives.sqlite3').
+
+    Parameters:
+    - archive_store_backend: A JsonArchiveStore, SqliteArchiveStore or object with the same methods.
+    """
+    global store, _cache_index
+    archive_store_backend.initialize()
+    store = archive_store_backend
+    _cache_index = None
+    month_cache.clear()
+    _month_meta.clear()
+    with _month_index_lock:
+        _month_indexes.clear()
+
+
+## Requests session from user-agent headers
+# the session is built on the first network call, so importing this module does no I/O
+user_agent_path = 'user-agent.json'
+user_agent = None
+session = None
+_session_lock = threading.Lock()
+
+# offline mode only serves archives from the cache and never makes a request
+offline = False
+
+def _loadUserAgent():
+    if not os.path.isfile(user_agent_path):
+        raise FileNotFoundError(f"The file '{user_agent_path}' is not found. Ensure that this file exists with a 'username' and 'email', or pass user_agent to archives_manager.configure().")
+
+    with open(user_agent_path, 'r') as file:
+        return json.load(file)
+
+def _getSession():
+    global session, user_agent
+
+    if session is None:
+        with _session_lock:
+            if session is None:
+                if user_agent is None:
+                    user_agent = _loadUserAgent()
+                session = _buildSession(user_agent)
+
+    return session
+
+def configure(user_agent_info=None, user_agent_file=None, archive_store_backend=None, offline_mode=None, lazy_heavy_fields=None, json_backend=None):
+    """
+    Configure the module before (or between) uses. Arguments left as None keep their current value.
+    Nothing is read from disk or the network here, the session is rebuilt on the next request.
 
+    Parameters:
+    - user_agent_info (dict): {'username': ..., 'email': ...} sent as the User-Agent, instead of reading user-agent.json.
+    - user_agent_file (str): Path of the user-agent json file. Default 'user-agent.json'.
+    - archive_store_backend: Storage backend for cached archives, see set_archive_store.
+    - offline_mode (bool): Only read the cache and return partial results when something is not cached, see get_offline_report. Default False.
+    - lazy_heavy_fields (bool): Return cached games as LazyGame records that load 'pgn', 'fen' and 'tcn' on first access. Default False.
+    - json_backend (str): 'orjson' or 'json' for decoding archives, see archive_store.set_json_backend. Default 'orjson' when installed.
+    """
+    global user_agent, user_agent_path, session, offline, lazy_fields
+
+    with _session_lock:
+        if user_agent_file is not None:
+            user_agent_path = user_agent_file
+            user_agent = None
+            session = None
+        if user_agent_info is not None:
+            user_agent = user_agent_info
+            session = None
+
+    if archive_store_backend is not None:
+        set_archive_store(archive_store_backend)
+    if offline_mode is not None:
+        offline = offline_mode
+    if lazy_heavy_fields is not None and lazy_heavy_fields != lazy_fields:
+        lazy_fields = lazy_heavy_fields
+        month_cache.clear()
+    if json_backend is not None:
+        archive_store.set_json_backend(json_backend)
+
+## Transport settings
+# connection pool size per host, should be at least the number of concurrent download workers
+pool_maxsize = 16
+# (connect, read) timeout in seconds
+timeout = (10, 60)
+# retries on 429, 5xx and connection errors, waiting backoff_factor * 2^attempt seconds (or Retry-After) in between
+max_retries = 5
+backoff_factor = 1.0
+backoff_max = 60
+
+_RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+def _acceptEncoding():
+    # brotli is only decoded by urllib3 if one of the brotli packages is installed
+    if importlib.util.find_spec('brotli') or importlib.util.find_spec('brotlicffi'):
+        return 'br, gzip, deflate'
+    return 'gzip, deflate'
+
+def _buildSession(user_agent):
+    new_session = requests.session()
+    new_session.headers["User-Agent"] = f"username: {user_agent['username']}, email: {user_agent['email']}"
+    new_session.headers["Accept-Encoding"] = _acceptEncoding()
+    new_session.headers["Connection"] = "keep-alive"
+
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize)
+    new_session.mount('https://', adapter)
+    new_session.mount('http://', adapter)
+    return new_session
+
+def configure_transport(pool_size=None, request_timeout=None, retries=None, backoff=None, max_backoff=None):
+    """
+    Change the transport settings, the session is rebuilt on the next request. Arguments left as None keep their current value.
 
-## Initialize directories
-os.makedirs('json/archive_lists', exist_ok=True)
-os.makedirs('json/archives', exist_ok=True)
+    Parameters:
+    - pool_size (int): Connections kept alive per host. Default 16.
+    - request_timeout (tuple): (connect, read) timeout in seconds. Default (10, 60).
+    - retries (int): Retries on 429, 5xx and connection errors before giving up. Default 5.
+    - backoff (float): First retry wait in seconds, doubling on each retry. Default 1.0.
+    - max_backoff (float): Longest wait between retries in seconds. Default 60.
+    """
+    global pool_maxsize, timeout, max_retries, backoff_factor, backoff_max, session
+
+    if pool_size is not None:
+        pool_maxsize = pool_size
+    if request_timeout is not None:
+        timeout = request_timeout
+    if retries is not None:
+        max_retries = retries
+    if backoff is not None:
+        backoff_factor = backoff
+    if max_backoff is not None:
+        backoff_max = max_backoff
+
+    with _session_lock:
+        session = None
+
+
+## Transfer statistics
+_stats_lock = threading.Lock()
+transfer_stats = {
+    'requests': 0,
+    'retries': 0,
+    'not_modified': 0,
+    'wire_bytes': 0,
+    'decoded_bytes': 0
+}
+
+def _recordTransfer(response):
+    # urllib3 counts the bytes pulled off the socket, before any content decoding
+    wire_bytes = response.raw.tell() if response.raw is not None else len(response.content)
+
+    with _stats_lock:
+        transfer_stats['requests'] += 1
+        transfer_stats['wire_bytes'] += wire_bytes
+        transfer_stats['decoded_bytes'] += len(response.content)
+        if response.status_code == 304:
+            transfer_stats['not_modified'] += 1
+
+def get_transfer_stats():
+    """
+    Returns a copy of the transfer statistics: requests made, retries, 304 responses,
+    bytes received on the wire and bytes after decompression.
+    """
+    with _stats_lock:
+        return dict(transfer_stats)
 
+def reset_transfer_stats():
+    with _stats_lock:
+        for key in transfer_stats:
+            transfer_stats[key] = 0
 
-## Initialize requests session from user-agent headers
-# read user-agent json
-with open('user-agent.json', 'r') as file:
-    user_agent = json.load(file)
 
-# init requests session
-session = requests.session()
-session.headers["User-Agent"] = f"username: {user_agent['username']}, email: {user_agent['email']}"
+## Rate limiting shared by every request made through the session
+class _TokenBucket:
+    """
+    Thread-safe token bucket. Each request takes one token, tokens refill at `rate` per second
+    and at most `burst` tokens can be saved up.
+    """
+
+    def __init__(self, rate, burst):
+        if rate <= 0 or burst < 1:
+            raise ValueError('rate must be positive and burst must be at least 1')
+
+        self.rate = float(rate)
+        self.burst = int(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# defaults match the old fixed 0.5 second sleep between requests
+rate_limiter = _TokenBucket(rate=2.0, burst=1)
+
+def set_rate_limit(requests_per_sec=2.0, burst=1):
+    """
+    Replace the shared rate limiter used by every request to api.chess.com.
+
+    Parameters:
+    - requests_per_sec (float): Sustained number of requests allowed per second. Default 2.0.
+    - burst (int): Number of requests that may be made back to back before throttling kicks in. Default 1.
+    """
+    global rate_limiter
+    rate_limiter = _TokenBucket(requests_per_sec, burst)
 
 
 # requests retrieval error
@@ -32,86 +250,652 @@ class ArchiveRetrievalError(Exception):
     pass
 
 
-# username matching
+def _retryWait(attempt, response=None):
+    if response is not None:
+        retry_after = response.headers.get('Retry-After')
+        if retry_after is not None and retry_after.isdigit():
+            return min(backoff_max, int(retry_after))
+
+    return min(backoff_max, backoff_factor * (2 ** attempt))
+
+def _get(url, headers=None):
+    """
+    Rate limited GET that retries with exponential backoff on 429, 5xx and connection errors.
+    Returns the last response once retries run out, the caller decides what to do with its status code.
+    """
+    if offline:
+        raise ArchiveRetrievalError(f"Not cached and offline mode is on, URL: {url}")
+
+    for attempt in range(max_retries + 1):
+        rate_limiter.acquire()
+
+        try:
+            response = _getSession().get(url, headers=headers, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt == max_retries:
+                raise ArchiveRetrievalError(f"Failed to connect: {e}, URL: {url}")
+            response = None
+        else:
+            _recordTransfer(response)
+            if response.status_code not in _RETRY_STATUS_CODES or attempt == max_retries:
+                return response
+
+        with _stats_lock:
+            transfer_stats['retries'] += 1
+        time.sleep(_retryWait(attempt, response))
+
+
+## Player identity
+# Usernames are compared case insensitively. Every username seen maps once to an interned lowercase name,
+# so a match is a dict lookup and an identity check instead of lowercasing both strings again.
+_canonical_names = {}
+_player_ids = {}
+_player_id_names = []
+_player_ids_lock = threading.Lock()
+
+def _canonicalName(username):
+    canonical_name = _canonical_names.get(username)
+    if canonical_name is None:
+        canonical_name = sys.intern(username.lower())
+        _canonical_names[username] = canonical_name
+    return canonical_name
+
 def _case_insensitive_match(str_a, str_b):
-    return str.lower(str_a) == str.lower(str_b)
+    return _canonicalName(str_a) is _canonicalName(str_b)
+
+def player_id(player_name):
+    """
+    Get the integer id of a username, the same for every capitalization of it and stable for the life of the process.
+    """
+    canonical_name = _canonicalName(player_name)
+    player_idx = _player_ids.get(canonical_name)
+    if player_idx is None:
+        with _player_ids_lock:
+            player_idx = _player_ids.get(canonical_name)
+            if player_idx is None:
+                player_idx = len(_player_id_names)
+                _player_id_names.append(canonical_name)
+                _player_ids[canonical_name] = player_idx
+    return player_idx
+
+def player_name_from_id(player_idx):
+    """
+    Get the lowercase username of a player id.
+    """
+    return _player_id_names[player_idx]
+
+def _canonicalizeGames(archived_games):
+    # games loaded from the store or api.chess.com share one interned string per username
+    for archived_game in archived_games:
+        for color in ('white', 'black'):
+            archived_game[color]['username'] = sys.intern(archived_game[color]['username'])
+    return archived_games
+
+def _playerIsWhite(archived_game, player_name):
+    """
+    True if player_name has white, False if black, None if the player is not in the game.
+    """
+    # innermost accessor of every dataset build, so the cache lookups are inlined
+    canonical_name = _canonical_names.get(player_name) or _canonicalName(player_name)
+    white_username = archived_game['white']['username']
+    if (_canonical_names.get(white_username) or _canonicalName(white_username)) is canonical_name:
+        return True
+    black_username = archived_game['black']['username']
+    if (_canonical_names.get(black_username) or _canonicalName(black_username)) is canonical_name:
+        return False
+    return None
+
+def game_perspective(archived_game, player_name):
+    """
+    Get a game from the point of view of one of its players.
+
+    Parameters:
+    - archived_game (dict): The archived game dictionary.
+    - player_name (str): The perspective player.
+
+    Returns:
+    - tuple: (is_white, player_idx, opponent_idx) with the player ids of both players.
+    """
+    is_white = _playerIsWhite(archived_game, player_name)
+    if is_white is None:
+        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
+
+    white_id = player_id(archived_game['white']['username'])
+    black_id = player_id(archived_game['black']['username'])
+    return (is_white, white_id, black_id) if is_white else (is_white, black_id, white_id)
+
+PERSPECTIVE_DTYPE = np.dtype([('is_white', np.bool_), ('player_idx', np.int32), ('opponent_idx', np.int32)])
+
+def game_perspectives(archived_games, player_name):
+    """
+    game_perspective for a list of games in one pass, as a structured array with PERSPECTIVE_DTYPE fields.
+    """
+    return np.array([game_perspective(archived_game, player_name) for archived_game in archived_games], dtype=PERSPECTIVE_DTYPE)
+
+
+## Cache validators
+# Open months (and archive lists) are revalidated with a conditional GET once their cached copy is older than this many seconds.
+revalidate_after = 3600
+
+# A month is closed, and its cached copy immutable, once it was fetched this many seconds after the month ended.
+closed_month_grace = 24 * 3600
+
+def _conditionalHeaders(validators):
+    headers = {}
+    if validators is None:
+        return headers
+
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('last_modified'):
+        headers['If-Modified-Since'] = validators['last_modified']
+
+    return headers
+
+def _responseValidators(response, previous=None):
+    # a 304 may omit validators, in which case the previous ones are still valid
+    previous = previous or {}
+    return {
+        'etag': response.headers.get('ETag', previous.get('etag')),
+        'last_modified': response.headers.get('Last-Modified', previous.get('last_modified')),
+        'fetched_at': time.time()
+    }
+
+def _monthEndUnix(year, month):
+    year, month = int(year), int(month)
+    if month == 12:
+        return calendar.timegm((year + 1, 1, 1, 0, 0, 0))
+    return calendar.timegm((year, month + 1, 1, 0, 0, 0))
+
+def _isMonthClosed(year, month, fetched_at):
+    return fetched_at >= _monthEndUnix(year, month) + closed_month_grace
+
+def _isStale(meta):
+    if offline or meta.get('immutable'):
+        return False
+    return time.time() - meta['fetched_at'] >= revalidate_after
+
+
+## Offline cache index
+# In offline mode cache lookups go through an in-memory index of what is cached, built once from a scan of
+# the store or from a manifest file, and anything missing is reported instead of raising.
+_cache_index = None
+_cache_index_lock = threading.Lock()
+
+offline_report = {
+    'missing_archive_lists': set(),
+    'missing_months': set()
+}
+
+def build_cache_index(manifest_path=None):
+    """
+    Build the in-memory index of cached archive lists and month archives used in offline mode.
+
+    Parameters:
+    - manifest_path (str): A manifest written by save_cache_manifest to load instead of scanning the store. Default None.
+
+    Returns:
+    - int: The number of month archives in the index.
+    """
+    global _cache_index
+
+    if manifest_path is not None:
+        with open(manifest_path, 'r') as json_file:
+            manifest = json.load(json_file)
+        archive_lists = set(manifest['archive_lists'])
+        months = set(tuple(key) for key in manifest['months'])
+    else:
+        archive_lists = set(player_name.lower() for player_name in store.iter_archives_lists())
+        months = set((player_name.lower(), year, month) for player_name, year, month in store.iter_months())
+
+    with _cache_index_lock:
+        _cache_index = {
+            'archive_lists': archive_lists,
+            'months': months
+        }
+
+    return len(months)
+
+def save_cache_manifest(manifest_path):
+    """
+    Write the cache index to a manifest file, so offline workers can load it instead of scanning the store.
+    """
+    index = _cacheIndex()
+    manifest = {
+        'archive_lists': sorted(index['archive_lists']),
+        'months': sorted(index['months'])
+    }
+
+    archive_store.write_file_atomic(manifest_path, json.dumps(manifest))
+
+def _cacheIndex():
+    if _cache_index is None:
+        build_cache_index()
+    return _cache_index
+
+def _indexAdd(kind, key):
+    # keep an already built index current as files are cached
+    if _cache_index is not None:
+        with _cache_index_lock:
+            _cache_index[kind].add(key)
+
+def get_offline_report():
+    """
+    Returns which archive lists and months were requested in offline mode but not cached, since the last reset.
+    Results returned while these were missing are partial.
+    """
+    return {
+        'missing_archive_lists': sorted(offline_report['missing_archive_lists']),
+        'missing_months': sorted(offline_report['missing_months'])
+    }
+
+def reset_offline_report():
+    offline_report['missing_archive_lists'].clear()
+    offline_report['missing_months'].clear()
+
+def _missingMonth(player_name, year, month):
+    offline_report['missing_months'].add((player_name.lower(), year, month))
+    return []
+
+
+## Parsed month archive cache
+# Parsed month archives are kept in memory, least recently used first out once their estimated size passes the limit.
+# Cached games are shared between calls, elo correction works on copies of the games it changes.
+class _MonthCache:
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def estimate_bytes(games):
+        # rough size of the parsed dicts, dominated by the pgn strings, without loading lazy fields
+        return sum(1024 + len(dict.get(game, 'pgn', '')) for game in games)
+
+    def get(self, key):
+        with self._lock:
+            games = self._entries.get(key)
+            if games is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return games[0]
+
+    def put(self, key, games):
+        size = self.estimate_bytes(games)
+        if size > self.max_bytes:
+            self.discard(key)
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (games, size)
+            self._bytes += size
+            self._evict()
+
+    def charge(self, key, loader, size):
+        """
+        Add size bytes to the entry of key once its lazy heavy fields are loaded, if it still holds the games of loader.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry[0] or getattr(entry[0][0], '_loader', None) is not loader:
+                return
+            self._entries[key] = (entry[0], entry[1] + size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        # callers hold _lock
+        while self._bytes > self.max_bytes:
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._bytes -= evicted_size
+            self.evictions += 1
+
+    def discard(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes
+            }
+
+month_cache = _MonthCache(max_bytes=512 * 1024 * 1024)
+
+def configure_month_cache(max_bytes):
+    """
+    Replace the in-memory cache of parsed month archives. 0 disables it.
+
+    Parameters:
+    - max_bytes (int): Estimated size of the parsed archives to keep in memory. Default 512 MB.
+    """
+    global month_cache
+    month_cache = _MonthCache(max_bytes)
+
+def get_month_cache_stats():
+    """
+    Returns the hits, misses, evictions, entry count and estimated size of the parsed month archive cache.
+    """
+    return month_cache.stats()
+
+
+## Lazy heavy fields
+# With lazy fields on, month archives read from the cache keep their games without the heavy fields below,
+# which most feature code never touches. They are read back from the store the first time one is accessed.
+HEAVY_FIELDS = ('pgn', 'fen', 'tcn')
+lazy_fields = False
+
+class _HeavyFieldLoader:
+    """
+    Shared by the games of one month archive, reads the month again on first access and keeps only its heavy fields.
+    The loaded fields are charged to the month's entry in the month cache, so they count against its size limit.
+    """
+
+    def __init__(self, player_name, year, month):
+        self.player_name = player_name
+        self.year = year
+        self.month = month
+        self._fields = None
+        self._lock = threading.Lock()
+
+    def fields(self, index):
+        with self._lock:
+            if self._fields is None:
+                games = store.read_month(self.player_name, self.year, self.month)
+                self._fields = [{field: game[field] for field in HEAVY_FIELDS if field in game} for game in games]
+                size = sum(len(value) for fields in self._fields for value in fields.values())
+                month_cache.charge((self.player_name.lower(), self.year, self.month), self, size)
+
+        return self._fields[index]
+
+class LazyGame(dict):
+    """
+    Archived game dictionary whose heavy fields ('pgn', 'fen', 'tcn') are loaded on first access.
+    Indexing, get() and 'in' load them, iterating over keys or items only sees the fields loaded so far.
+    """
+
+    __slots__ = ('_loader', '_index')
+
+    def __init__(self, data, loader, index):
+        super().__init__(data)
+        self._loader = loader
+        self._index = index
+
+    def _materialize(self):
+        if self._loader is not None:
+            loader, self._loader = self._loader, None
+            dict.update(self, loader.fields(self._index))
+
+    def __missing__(self, key):
+        if key in HEAVY_FIELDS and self._loader is not None:
+            self._materialize()
+            if dict.__contains__(self, key):
+                return dict.__getitem__(self, key)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        if key in HEAVY_FIELDS:
+            self._materialize()
+        return dict.__contains__(self, key)
+
+    def get(self, key, default=None):
+        if key in HEAVY_FIELDS:
+            self._materialize()
+        return dict.get(self, key, default)
+
+    def copy(self):
+        return LazyGame(self, self._loader, self._index)
+
+    def materialize(self):
+        """
+        Returns a plain dictionary with every field loaded.
+        """
+        self._materialize()
+        return dict(self)
+
+def _lightMonth(player_name, year, month, games):
+    if not lazy_fields:
+        return games
+
+    loader = _HeavyFieldLoader(player_name, year, month)
+    return [
+        LazyGame({key: value for key, value in game.items() if key not in HEAVY_FIELDS}, loader, index)
+        for index, game in enumerate(games)
+    ]
 
 
 ## Monthly Archives Lists
+api_base_url = "https://api.chess.com/pub"
+
 def _jsonMonthlyArchivesListURL(player_name):
-    return f"https://api.chess.com/pub/player/{player_name}/games/archives"
+    return f"{api_base_url}/player/{player_name}/games/archives"
 
-def _requestMonthlyArchivesList(player_name):
-    time.sleep(0.5)
-    response = session.get(_jsonMonthlyArchivesListURL(player_name))
+def _requestMonthlyArchivesList(player_name, validators=None):
+    """
+    Returns (list data, validators). List data is None if the server answered 304 Not Modified.
+    """
+    response = _get(_jsonMonthlyArchivesListURL(player_name), headers=_conditionalHeaders(validators))
 
-    if response.status_code == 200:
+    if response.status_code == 304 and validators is not None:
+        return None, _responseValidators(response, validators)
+    elif response.status_code == 200:
         data = response.json()['archives']
-        return data
+        return data, _responseValidators(response)
     else:
         raise ArchiveRetrievalError(f"Failed to retrieve player {player_name} data: {response.status_code}")
 
-def _monthlyArchivesFilePath(player_name):
-    file_name = f'{player_name.lower()}.json'
-    file_path = os.path.join('json', 'archive_lists', file_name)
-    return file_path
-
 def _monthlyArchivesListExists(player_name):
-    return os.path.isfile(_monthlyArchivesFilePath(player_name))
+    if offline:
+        return player_name.lower() in _cacheIndex()['archive_lists']
+    return store.has_archives_list(player_name)
 
 def _saveMonthlyArchivesList(player_name, list_data):
-    with open(_monthlyArchivesFilePath(player_name), 'w') as json_file:
-        json.dump(list_data, json_file)
+    store.save_archives_list(player_name, list_data)
+    _indexAdd('archive_lists', player_name.lower())
+
+def _offlineMonthlyArchivesList(player_name):
+    # without a cached list, the cached months of the player are the best available list
+    if _monthlyArchivesListExists(player_name):
+        return _readMonthlyArchivesList(player_name)
+
+    player_key = player_name.lower()
+    months = sorted((year, month) for (indexed_player, year, month) in _cacheIndex()['months'] if indexed_player == player_key)
+    if len(months) == 0:
+        offline_report['missing_archive_lists'].add(player_key)
+
+    return [f"{api_base_url}/player/{player_key}/games/{year}/{month}" for year, month in months]
 
 def _readMonthlyArchivesList(player_name):
-    with open(_monthlyArchivesFilePath(player_name), 'r') as json_file:
-        list_data = json.load(json_file)
-    
-    return list_data
+    return store.read_archives_list(player_name)
 
 def _getMonthlyArchivesList(player_name):
-    if _monthlyArchivesListExists(player_name):
+    if offline:
+        return _offlineMonthlyArchivesList(player_name)
+
+    if _monthlyArchivesListExists(player_name) and not _isStale(store.read_archives_list_meta(player_name)):
         return _readMonthlyArchivesList(player_name)
-    else:
-        data = _requestMonthlyArchivesList(player_name)
+
+    # single flight, workers waiting on the lock find the list another worker just saved
+    with store.fetch_lock(f'{player_name}/archives'):
+        if _monthlyArchivesListExists(player_name):
+            meta = store.read_archives_list_meta(player_name)
+            if not _isStale(meta):
+                return _readMonthlyArchivesList(player_name)
+
+            data, meta = _requestMonthlyArchivesList(player_name, meta)
+            if data is None:
+                store.save_archives_list_meta(player_name, meta)
+                return _readMonthlyArchivesList(player_name)
+        else:
+            data, meta = _requestMonthlyArchivesList(player_name)
+
         _saveMonthlyArchivesList(player_name, data)
-        return data
+        store.save_archives_list_meta(player_name, meta)
+    return data
 
 
 ## Per-Month Archived Games (as downloaded from api.chess.com)
-def _requestArchivedGames(month_url):
-    time.sleep(0.5)
-    response = session.get(month_url)
+def _requestArchivedGames(month_url, validators=None):
+    """
+    Returns (games, validators). Games is None if the server answered 304 Not Modified.
+    """
+    response = _get(month_url, headers=_conditionalHeaders(validators))
 
-    if response.status_code == 200:
+    if response.status_code == 304 and validators is not None:
+        return None, _responseValidators(response, validators)
+    elif response.status_code == 200:
         data = response.json()['games']
-        return data
+        return data, _responseValidators(response)
     else:
         raise ArchiveRetrievalError(f"Failed to retrieve month archive data: {response.status_code}, URL: {month_url}")
 
-def _archivedGamesFilePath(player_name, year, month):
-    file_name = f'{player_name.lower()}.json'
-    file_path = os.path.join('json', 'archives', player_name, year, f'{month}.json')
-    return file_path
-
 def _archivedGamesExists(player_name, year, month):
-    return os.path.isfile(_archivedGamesFilePath(player_name, year, month))
+    if offline:
+        return (player_name.lower(), year, month) in _cacheIndex()['months']
+    return store.has_month(player_name, year, month)
 
 def _saveArchivedGames(player_name, year, month, list_data):
-    file_path = _archivedGamesFilePath(player_name, year, month)
-    os.makedirs(os.path.dirname(file_path), exist_ok=True)
-
-    with open(file_path, 'w') as json_file:
-        json.dump(list_data, json_file)
+    _canonicalizeGames(list_data)
+    store.save_month(player_name, year, month, list_data)
+    _updateMonthIndex(player_name, year, month, list_data)
+    _indexAdd('months', (player_name.lower(), year, month))
+    month_cache.put((player_name.lower(), year, month), _lightMonth(player_name, year, month, list_data))
 
 def _readArchivedGames(player_name, year, month):
-    with open(_archivedGamesFilePath(player_name, year, month), 'r') as json_file:
-        list_data = json.load(json_file)
-    
+    key = (player_name.lower(), year, month)
+    list_data = month_cache.get(key)
+    if list_data is None:
+        list_data = _lightMonth(player_name, year, month, _canonicalizeGames(store.read_month(player_name, year, month)))
+        month_cache.put(key, list_data)
+
     return list_data
 
+# validators of month archives already read in this process, so freshness checks do not re-read them
+_month_meta = {}
+
+def _readArchivedGamesMeta(player_name, year, month):
+    key = (player_name.lower(), year, month)
+    meta = _month_meta.get(key)
+    if meta is None:
+        meta = store.read_month_meta(player_name, year, month)
+        if 'immutable' not in meta:
+            meta['immutable'] = _isMonthClosed(year, month, meta['fetched_at'])
+        _month_meta[key] = meta
+    return meta
+
+def _saveArchivedGamesMeta(player_name, year, month, meta):
+    meta['immutable'] = _isMonthClosed(year, month, meta['fetched_at'])
+    store.save_month_meta(player_name, year, month, meta)
+    _month_meta[(player_name.lower(), year, month)] = meta
+
+
+## Month boundary index
+# Per player, every cached month gets an entry with its first and last end_time, game count and games per time class,
+# persisted in the store. Window queries use it to skip months and binary search inside them.
+_month_indexes = {}
+_month_index_lock = threading.Lock()
+
+def _buildMonthIndexEntry(archived_games):
+    end_times = [archived_game['end_time'] for archived_game in archived_games]
+
+    time_classes = {}
+    for archived_game in archived_games:
+        time_classes[archived_game['time_class']] = time_classes.get(archived_game['time_class'], 0) + 1
+
+    return {
+        'first_end_time': min(end_times) if end_times else None,
+        'last_end_time': max(end_times) if end_times else None,
+        'num_games': len(archived_games),
+        'time_classes': time_classes,
+        'sorted': all(end_times[i] <= end_times[i+1] for i in range(len(end_times) - 1))
+    }
+
+def _loadMonthIndex(player_name):
+    # callers hold _month_index_lock
+    player_key = player_name.lower()
+    if player_key not in _month_indexes:
+        _month_indexes[player_key] = store.read_month_index(player_name) or {}
+    return _month_indexes[player_key]
+
+def _updateMonthIndex(player_name, year, month, archived_games):
+    entry = _buildMonthIndexEntry(archived_games)
+    # other processes may have saved entries since this one loaded the index, so merge into the stored copy
+    with _month_index_lock, store.fetch_lock(f'{player_name}/month_index'):
+        month_index = store.read_month_index(player_name) or {}
+        month_index[f'{year}/{month}'] = entry
+        store.save_month_index(player_name, month_index)
+        _month_indexes[player_name.lower()] = month_index
+    return entry
+
+def _monthIndexEntry(player_name, year, month):
+    """
+    Index entry of a cached month, built from the month archive the first time it is needed.
+    """
+    with _month_index_lock:
+        entry = _loadMonthIndex(player_name).get(f'{year}/{month}')
+    if entry is None:
+        entry = _updateMonthIndex(player_name, year, month, _readArchivedGames(player_name, year, month))
+    return entry
+
+def _freshMonthIndexEntry(player_name, year, month):
+    # entries are only trusted for cached months that do not need to be fetched or revalidated
+    if not _archivedGamesExists(player_name, year, month) or _archivedGamesNeedsFetch(player_name, year, month):
+        return None
+    return _monthIndexEntry(player_name, year, month)
+
+def _monthMayHaveGames(entry, start_unix, end_unix, time_class):
+    if entry['num_games'] == 0:
+        return False
+    if entry['first_end_time'] > end_unix or entry['last_end_time'] < start_unix:
+        return False
+    if time_class is not None and entry['time_classes'].get(time_class, 0) == 0:
+        return False
+    return True
+
+def get_month_index(player_name):
+    """
+    Get the month boundary index of a player's cached months, building entries for months cached before the index existed.
+
+    Parameters:
+    - player_name (str): The player's username on chess.com
+
+    Returns:
+    - dict: {'<year>/<month>': {
+        'first_end_time': Earliest game end_time in the month.
+        'last_end_time': Latest game end_time in the month.
+        'num_games': Number of games in the month.
+        'time_classes': Number of games per time class.
+        'sorted': Whether the month archive is ordered by end_time.
+    }}
+    """
+    for month_player, year, month in store.iter_months(player_name):
+        _monthIndexEntry(month_player, year, month)
+
+    with _month_index_lock:
+        return dict(_loadMonthIndex(player_name))
+
+@functools.lru_cache(maxsize=65536)
 def _extract_url_data(month_url):
-    url_regex = r"https://api.chess.com/pub/player/([^/]+)/games/(\d{4})/(\d{2})"
+    url_regex = r"/pub/player/([^/]+)/games/(\d{4})/(\d{2})"
     match = re.search(url_regex, month_url)
     
     if match:
@@ -124,16 +908,184 @@ def _extract_url_data(month_url):
     else:
         return None
 
+def _archivedGamesNeedsFetch(player_name, year, month):
+    if offline:
+        if not _archivedGamesExists(player_name, year, month):
+            _missingMonth(player_name, year, month)
+        return False
+
+    if not _archivedGamesExists(player_name, year, month):
+        return True
+    return _isStale(_readArchivedGamesMeta(player_name, year, month))
+
+def _reloadMonthFromStore(player_name, year, month):
+    """
+    Called holding the month's fetch lock. Another thread or process may have saved the month since this one
+    last read it, so its validators are read again from the store. The in-memory copies of the month are only
+    dropped when the stored validators differ from the ones this process knows, i.e. a new copy was saved.
+    """
+    key = (player_name.lower(), year, month)
+    stored_meta = store.read_month_meta(player_name, year, month)
+    known_meta = _month_meta.get(key)
+
+    if known_meta is None or any(known_meta.get(field) != stored_meta.get(field) for field in ('etag', 'last_modified', 'fetched_at')):
+        _month_meta.pop(key, None)
+        month_cache.discard(key)
+        with _month_index_lock:
+            _month_indexes.pop(key[0], None)
+
+    return _readArchivedGamesMeta(player_name, year, month)
+
+def _fetchArchivedGames(month_url, force=False):
+    """
+    Download a month archive, or revalidate a cached one with a conditional GET.
+    Returns the games, or None if the cached copy was still current.
+
+    Only one thread or process downloads a given month at a time. The others wait for it and, unless force
+    is set, use the copy it saved instead of requesting the month again.
+    """
+    url_data = _extract_url_data(month_url)
+    player_name, year, month = url_data['player_name'], url_data['year'], url_data['month']
+
+    with store.fetch_lock(f'{player_name}/{year}/{month}'):
+        validators = None
+        if store.has_month(player_name, year, month):
+            validators = _reloadMonthFromStore(player_name, year, month)
+            _indexAdd('months', (player_name.lower(), year, month))
+            if not force and not _isStale(validators):
+                return None
+
+        data, meta = _requestArchivedGames(month_url, validators)
+        if data is not None:
+            _saveArchivedGames(player_name, year, month, data)
+        _saveArchivedGamesMeta(player_name, year, month, meta)
+
+    return data
+
 def _getArchivedGames(month_url):
     url_data = _extract_url_data(month_url)
     player_name, year, month = url_data['player_name'], url_data['year'], url_data['month']
 
-    if _archivedGamesExists(player_name, year, month):
+    if offline and not _archivedGamesExists(player_name, year, month):
+        return _missingMonth(player_name, year, month)
+
+    if not _archivedGamesNeedsFetch(player_name, year, month):
         return _readArchivedGames(player_name, year, month)
-    else:
-        data = _requestArchivedGames(month_url)
-        _saveArchivedGames(player_name, year, month, data)
-        return data
+
+    data = _fetchArchivedGames(month_url)
+    if data is None:
+        return _readArchivedGames(player_name, year, month)
+    return data
+
+def sync_month(player_name, year, month):
+    """
+    Revalidate one month archive right away, whatever its cache age, with a conditional request.
+    Months already marked immutable are read from the cache.
+
+    Parameters:
+    - player_name (str): The player's username on chess.com
+    - year (str): Four digit year, e.g. '2023'.
+    - month (str): Two digit month, e.g. '11'.
+
+    Returns:
+    - tuple: (games, changed) where games is the month's archived games and changed is False if the cached copy was current.
+    """
+    if _archivedGamesExists(player_name, year, month) and _readArchivedGamesMeta(player_name, year, month)['immutable']:
+        return _readArchivedGames(player_name, year, month), False
+
+    data = _fetchArchivedGames(f"{api_base_url}/player/{player_name.lower()}/games/{year}/{month}", force=True)
+    if data is None:
+        return _readArchivedGames(player_name, year, month), False
+    return data, True
+
+def refresh_player_archives(player_name, max_workers=4):
+    """
+    Bring a player's cached archives up to date. The archives list and every open month are revalidated
+    with conditional requests, closed months that are already cached are never requested again.
+
+    Parameters:
+    - player_name (str): The player's username on chess.com
+    - max_workers (int): Number of concurrent downloads. Default 4.
+
+    Returns:
+    - int: The number of month archives that were requested.
+    """
+    return prefetch_archived_games(_getMonthlyArchivesList(player_name), max_workers=max_workers)
+
+def prefetch_archived_games(month_urls, max_workers=4):
+    """
+    Download every month archive in a list that is not already cached or whose open month cache is due for revalidation, using a pool of worker threads.
+    All workers share the module rate limiter, so max_workers only controls how many requests can be in flight at once.
+
+    Parameters:
+    - month_urls (list): Monthly archive URLs as returned by the archives list endpoint.
+    - max_workers (int): Number of concurrent downloads. Default 4.
+
+    Returns:
+    - int: The number of month archives that were requested.
+    """
+    missing_urls = []
+    for month_url in dict.fromkeys(month_urls):
+        url_data = _extract_url_data(month_url)
+        if _archivedGamesNeedsFetch(url_data['player_name'], url_data['year'], url_data['month']):
+            missing_urls.append(month_url)
+
+    if len(missing_urls) == 0:
+        return 0
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(_fetchArchivedGames, month_url): month_url for month_url in missing_urls}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except ArchiveRetrievalError as e:
+                failures.append(str(e))
+
+    if failures:
+        raise ArchiveRetrievalError(f"Failed to prefetch {len(failures)} of {len(missing_urls)} month archives: {failures[0]}")
+
+    return len(missing_urls)
+
+def fetch_player_windows(player_windows, max_workers=4):
+    """
+    Download everything needed to answer many (player, window) requests at once, e.g. every opponent's
+    30 day window in a dataset build. Archive lists are requested concurrently, the month URLs of all
+    windows are merged so every month is requested at most once, and missing months are then downloaded
+    concurrently. Afterwards get_games_between_timestamps answers each window from the cache.
+
+    With archive_store.SqliteArchiveStore each game shared by two requested players is stored once.
+
+    Parameters:
+    - player_windows (list): (player_name, start_unix, end_unix) tuples.
+    - max_workers (int): Number of concurrent downloads. Default 4.
+
+    Returns:
+    - dict: {
+        'months_requested': Number of months covered by the windows, counting overlaps.
+        'months_planned': Number of distinct months the windows need.
+        'months_downloaded': Number of months that had to be requested from api.chess.com.
+    }
+    """
+    player_names = list(dict.fromkeys(player_name.lower() for player_name, _, _ in player_windows))
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(_getMonthlyArchivesList, player_names))
+
+    months_requested = 0
+    planned_urls = {}
+    for player_name, start_unix, end_unix in player_windows:
+        month_urls = _monthsInWindow(player_name, start_unix, end_unix)
+        months_requested += len(month_urls)
+        planned_urls.update(dict.fromkeys(month_urls))
+
+    months_downloaded = prefetch_archived_games(list(planned_urls), max_workers=max_workers)
+
+    return {
+        'months_requested': months_requested,
+        'months_planned': len(planned_urls),
+        'months_downloaded': months_downloaded
+    }
 
 def _filterOutArchiveListAfterUnixTimestamp(monthly_archived_list, unix_timestamp):
     time_tuple = time.gmtime(unix_timestamp)
@@ -167,59 +1119,426 @@ def _filterOutArchiveListBeforeUnixTimestamp(monthly_archived_list, unix_timesta
 
     return filtered_archive_list
 
+def _copyForCorrection(archived_game):
+    # cached games are shared, so correction changes copies of the game and its player dicts
+    corrected_game = archived_game.copy()
+    corrected_game['white'] = dict(archived_game['white'])
+    corrected_game['black'] = dict(archived_game['black'])
+    return corrected_game
+
+def _correctGameElo(archived_game, player_name, pre_game_player_elo, elo_change):
+    if _playerIsWhite(archived_game, player_name):
+        archived_game['white']['rating'] = pre_game_player_elo
+        archived_game['black']['rating'] += elo_change
+    else:
+        archived_game['black']['rating'] = pre_game_player_elo
+        archived_game['white']['rating'] += elo_change
+
+def _averageAbsEloChange(abs_elo_changes):
+    # accumulated term by term in chronological order like the original loop, avg += abs(change) / (n-1),
+    # so an average that lands next to x.5 rounds the same way
+    abs_elo_changes = np.asarray(abs_elo_changes, dtype=np.float64)
+    return float(np.add.accumulate(abs_elo_changes / len(abs_elo_changes))[-1])
+
+def _streamedAverageAbsEloChange(abs_elo_change_sum, num_changes, replay_abs_elo_changes):
+    # average of a run seen newest first, from the sum of its abs elo changes so memory stays constant.
+    # The original loop adds abs(change) / (n-1) oldest first in floats, which rounds to the same int as the exact
+    # average unless that lies on a half, or for very long runs within rounding error of one. Only then are the
+    # changes replayed oldest first with replay_abs_elo_changes() to add them up in the same order
+    average = abs_elo_change_sum / num_changes
+    if isinstance(abs_elo_change_sum, int):
+        q, rem = divmod(2 * abs_elo_change_sum, num_changes)
+        half_distance = (rem if q % 2 else num_changes - rem) / (2 * num_changes)
+        if half_distance > (num_changes + 1) * (average + 1) * 2**-50:
+            return average
+
+    average = 0
+    for abs_elo_change in replay_abs_elo_changes():
+        average += abs_elo_change / num_changes
+    return average
+
+def _absEloChanges(archived_games, player_name):
+    prev_player_elo = None
+    for archived_game in archived_games:
+        player_elo = get_elo(archived_game, player_name)['Player']
+        if prev_player_elo is not None:
+            yield abs(player_elo - prev_player_elo)
+        prev_player_elo = player_elo
+
+def _correctFirstGameElo(first_game, player_name, average_abs_elo_change):
+    # the first game has no previous rating, so guess one based on average abs elo change
+    won = get_won(first_game, player_name)
+    if won == None:
+        return
+    average_abs_elo_change = int(round(average_abs_elo_change))
+    if _playerIsWhite(first_game, player_name):
+        if won == 1:
+            first_game['white']['rating'] -= average_abs_elo_change
+            first_game['black']['rating'] += average_abs_elo_change
+        else:
+            first_game['white']['rating'] += average_abs_elo_change
+            first_game['black']['rating'] -= average_abs_elo_change
+    else:
+        if won == 1:
+            first_game['white']['rating'] += average_abs_elo_change
+            first_game['black']['rating'] -= average_abs_elo_change
+        else:
+            first_game['white']['rating'] -= average_abs_elo_change
+            first_game['black']['rating'] += average_abs_elo_change
+
+def correct_elo_columns(white_elo, black_elo, is_white, won):
+    """
+    Vectorized pre-game elo correction over the rating columns of a player's games, ordered oldest first.
+    Each game gets the player's rating after the previous game, the opponent's rating is moved by the same
+    change, and the first game is corrected by the average abs elo change in the direction of its result.
+
+    Parameters:
+    - white_elo (array-like): Post-game white ratings.
+    - black_elo (array-like): Post-game black ratings.
+    - is_white (array-like): True where the perspective player had white.
+    - won (array-like): 1 where the perspective player won, 0 where they lost, None or nan for draws.
+
+    Returns:
+    - tuple: (white_elo, black_elo) new int64 arrays with the corrected ratings, the inputs are not modified.
+    """
+    white_elo = np.array(white_elo, dtype=np.int64)
+    black_elo = np.array(black_elo, dtype=np.int64)
+    n = len(white_elo)
+
+    if n < 2:
+        return white_elo, black_elo
+
+    is_white = np.asarray(is_white, dtype=bool)
+    player_elo = np.where(is_white, white_elo, black_elo)
+    opponent_elo = np.where(is_white, black_elo, white_elo)
+
+    elo_changes = np.diff(player_elo)
+    corrected_player_elo = np.empty_like(player_elo)
+    corrected_player_elo[1:] = player_elo[:-1]
+    corrected_opponent_elo = opponent_elo.copy()
+    corrected_opponent_elo[1:] += elo_changes
+
+    # the first game has no previous rating, so guess one based on average abs elo change
+    average_abs_elo_change = int(round(_averageAbsEloChange(np.abs(elo_changes))))
+    first_won = np.asarray(won, dtype=np.float64)[0]
+    corrected_player_elo[0] = player_elo[0]
+    if first_won == 1:
+        corrected_player_elo[0] -= average_abs_elo_change
+        corrected_opponent_elo[0] += average_abs_elo_change
+    elif first_won == 0:
+        corrected_player_elo[0] += average_abs_elo_change
+        corrected_opponent_elo[0] -= average_abs_elo_change
+
+    return (
+        np.where(is_white, corrected_player_elo, corrected_opponent_elo),
+        np.where(is_white, corrected_opponent_elo, corrected_player_elo)
+    )
+
+def _correctedEloColumns(archived_games, player_name):
+    white_elo = [archived_game['white']['rating'] for archived_game in archived_games]
+    black_elo = [archived_game['black']['rating'] for archived_game in archived_games]
+    is_white = [get_color(archived_game, player_name) for archived_game in archived_games]
+    won = [get_won(archived_games[0], player_name)] if archived_games else []
+    return correct_elo_columns(white_elo, black_elo, is_white, won)
+
+def _withRatings(archived_game, white_elo, black_elo):
+    corrected_game = _copyForCorrection(archived_game)
+    corrected_game['white']['rating'] = int(white_elo)
+    corrected_game['black']['rating'] = int(black_elo)
+    return corrected_game
+
 def _correct_archive_elo(archived_games, player_name):
     """
     Function used in archived game retrieval to make the rated elo for each game
     representative of what the elo was at game start, as opposed to chess.com rating after game was completed.
+    Returns corrected copies of the games, the games passed in are not modified.
     """
+    if len(archived_games) < 2:
+        return [_copyForCorrection(archived_game) for archived_game in archived_games]
 
-    n = len(archived_games)
+    white_elo, black_elo = _correctedEloColumns(archived_games, player_name)
+    return [_withRatings(archived_game, white_elo[i], black_elo[i]) for i, archived_game in enumerate(archived_games)]
 
-    if n < 2:
+def _correctEloNewestFirst(tagged_games, player_name, replay_run):
+    """
+    Streaming version of _correct_archive_elo for (game, filtered) pairs ordered newest first.
+    Each game is corrected with the rating of the next older game, so only one game is held back.
+    The oldest game is corrected last, once the average abs elo change over the whole run is known.
+    replay_run(oldest_game, num_games) replays the run's games oldest first, in case that average needs them again.
+    """
+    tagged_games = ((_copyForCorrection(archived_game), filtered) for archived_game, filtered in tagged_games)
+    newer = next(tagged_games, None)
+    if newer is None:
         return
 
-    prev_player_elo = get_elo(archived_games[0], player_name)['Player']
-    average_abs_elo_change = 0
+    num_games = 1
+    abs_elo_change_sum = 0
+
+    for older in tagged_games:
+        older_player_elo = get_elo(older[0], player_name)['Player']
+        elo_change = get_elo(newer[0], player_name)['Player'] - older_player_elo
+
+        _correctGameElo(newer[0], player_name, older_player_elo, elo_change)
+
+        num_games += 1
+        abs_elo_change_sum += abs(elo_change)
 
-    # correct games after the first one
-    for archived_game in archived_games[1:]:
+        yield newer
+        newer = older
+
+    if num_games >= 2:
+        oldest_game = newer[0]
+        replay_abs_elo_changes = lambda: _absEloChanges(replay_run(oldest_game, num_games), player_name)
+        _correctFirstGameElo(oldest_game, player_name, _streamedAverageAbsEloChange(abs_elo_change_sum, num_games - 1, replay_abs_elo_changes))
+
+    yield newer
+
+def _correctEloChronological(tagged_games, player_name, average_abs_elo_change):
+    """
+    Streaming version of _correct_archive_elo for (game, filtered) pairs ordered oldest first.
+    The average abs elo change over the run has to be known up front to correct the first game.
+    """
+    prev_player_elo = None
+
+    for archived_game, filtered in tagged_games:
+        archived_game = _copyForCorrection(archived_game)
         uncorrected_player_elo = get_elo(archived_game, player_name)['Player']
-        elo_change = uncorrected_player_elo - prev_player_elo
 
-        white_player = archived_game['white']['username']
-        if _case_insensitive_match(white_player, player_name):
-            archived_game['white']['rating'] = prev_player_elo
-            archived_game['black']['rating'] += elo_change
+        if prev_player_elo is None:
+            _correctFirstGameElo(archived_game, player_name, average_abs_elo_change)
         else:
-            archived_game['black']['rating'] = prev_player_elo
-            archived_game['white']['rating'] += elo_change
+            _correctGameElo(archived_game, player_name, prev_player_elo, uncorrected_player_elo - prev_player_elo)
 
-        average_abs_elo_change += (abs(elo_change) / (n-1))
         prev_player_elo = uncorrected_player_elo
+        yield archived_game, filtered
 
-    # correct the first game as a guess based on average abs elo change
-    first_game = archived_games[0]
-    won = get_won(first_game, player_name)
-    if won == None:
+def _iterGamesInWindow(player_name, monthly_archived_list, start_unix, end_unix, time_class, newest_first=True, verbose=False, use_queries=True, predicate=None):
+    """
+    Yield a player's games of a time class with start_unix <= end_time <= end_unix.
+    Month archives are only loaded as the iteration reaches them. Stores that support queries
+    answer the window with an index range scan after making sure every month is cached,
+    unless use_queries is False and the games have to come in month archive order.
+    A predicate from ArchiveFilter.sql_predicate is added to the query, other stores ignore it.
+    """
+    if use_queries and store.supports_queries:
+        for month_url in monthly_archived_list:
+            url_data = _extract_url_data(month_url)
+            if _archivedGamesNeedsFetch(url_data['player_name'], url_data['year'], url_data['month']):
+                _fetchArchivedGames(month_url)
+
+        for archived_game in store.query_games(player_name, start_unix, end_unix, time_class=time_class, newest_first=newest_first, predicate=predicate):
+            if verbose:
+                print(archived_game['end_time'], archived_game['white']['username'], "v.s.", archived_game['black']['username'])
+            yield archived_game
         return
-    white_player = first_game['white']['username']
-    average_abs_elo_change = int(round(average_abs_elo_change))
-    if _case_insensitive_match(white_player, player_name):
-        if won == 1:
-            first_game['white']['rating'] -= average_abs_elo_change
-            first_game['black']['rating'] += average_abs_elo_change
-        else:
-            first_game['white']['rating'] += average_abs_elo_change
-            first_game['black']['rating'] -= average_abs_elo_change
+
+    month_order = reversed(monthly_archived_list) if newest_first else monthly_archived_list
+    for month_url in month_order:
+        url_data = _extract_url_data(month_url)
+        entry = _freshMonthIndexEntry(url_data['player_name'], url_data['year'], url_data['month'])
+        if entry is not None and not _monthMayHaveGames(entry, start_unix, end_unix, time_class):
+            continue
+
+        archived_games = _getArchivedGames(month_url)
+
+        # months ordered by end_time only need the slice inside the window
+        first, last = 0, len(archived_games)
+        if entry is not None and entry['sorted']:
+            first = bisect.bisect_left(archived_games, start_unix, key=lambda archived_game: archived_game['end_time'])
+            last = bisect.bisect_right(archived_games, end_unix, lo=first, key=lambda archived_game: archived_game['end_time'])
+
+        month_range = range(last - 1, first - 1, -1) if newest_first else range(first, last)
+        for i in month_range:
+            archived_game = archived_games[i]
+            if verbose:
+                print(archived_game['end_time'], archived_game['white']['username'], "v.s.", archived_game['black']['username'])
+
+            unix_timestamp = archived_game['end_time']
+            if unix_timestamp > end_unix or unix_timestamp < start_unix:
+                continue
+
+            if time_class is not None and archived_game['time_class'] != time_class:
+                continue
+
+            yield archived_game
+
+def _iterRecentGamesNewestFirst(monthly_archived_list, time_class, max_games_searched, prefetch_months=None, max_workers=4):
+    """
+    Yield a player's games of a time class newest first, considering at most max_games_searched games of any time class.
+    """
+    games_searched = 0
+
+    for i in range(len(monthly_archived_list)):
+        if prefetch_months and i % prefetch_months == 0:
+            batch = monthly_archived_list[max(0, len(monthly_archived_list) - i - prefetch_months):len(monthly_archived_list) - i]
+            prefetch_archived_games(batch, max_workers=max_workers)
+
+        month_url = monthly_archived_list[-(i+1)]
+
+        # months without games of the time class still count towards the games searched
+        url_data = _extract_url_data(month_url)
+        entry = _freshMonthIndexEntry(url_data['player_name'], url_data['year'], url_data['month'])
+        if entry is not None and time_class is not None and entry['time_classes'].get(time_class, 0) == 0:
+            games_searched = min(max_games_searched, games_searched + entry['num_games'])
+            if games_searched == max_games_searched:
+                return
+            continue
+
+        archived_games = _getArchivedGames(month_url)
+
+        for archived_game in reversed(archived_games):
+            if games_searched == max_games_searched:
+                return
+            games_searched += 1
+
+            if time_class is not None and archived_game['time_class'] != time_class:
+                continue
+
+            yield archived_game
+
+def _tagFilteredGames(archived_games, filter_func, max_unfiltered=None):
+    """
+    Pair each game with whether filter_func rejects it, stopping once max_unfiltered games were accepted.
+    Rejected games are kept in the sequence because they still take part in elo correction.
+    """
+    num_unfiltered = 0
+
+    for archived_game in archived_games:
+        if max_unfiltered is not None and num_unfiltered == max_unfiltered:
+            return
+
+        filtered = True if (filter_func and filter_func(archived_game) == False) else False
+        yield archived_game, filtered
+
+        if not filtered:
+            num_unfiltered += 1
+
+def _collectGames(tagged_games_newest_first, player_name, correct_elo):
+    tagged_games = list(tagged_games_newest_first)
+    tagged_games.reverse()
+
+    # cached games are shared, so even uncorrected results are copies
+    if not correct_elo or len(tagged_games) < 2:
+        return [_copyForCorrection(archived_game) for archived_game, filtered in tagged_games if not filtered]
+
+    # filtered games take part in the correction but are never copied
+    white_elo, black_elo = _correctedEloColumns([archived_game for archived_game, _ in tagged_games], player_name)
+    return [
+        _withRatings(archived_game, white_elo[i], black_elo[i])
+        for i, (archived_game, filtered) in enumerate(tagged_games) if not filtered
+    ]
+
+def _pushedDownPredicate(filter_func, correct_elo):
+    # filtered games are only needed for elo correction, without it an ArchiveFilter can run inside the store query
+    if correct_elo or not store.supports_queries or not isinstance(filter_func, ArchiveFilter):
+        return None
+    return filter_func.sql_predicate()
+
+def _gameId(archived_game):
+    return archived_game.get('uuid') or archived_game['url']
+
+def _replayRun(replay_oldest_first, oldest_game, num_games):
+    # the games of a run oldest first, replayed from the boundary of its oldest game
+    oldest_game_id = _gameId(oldest_game)
+    started = False
+    for tagged_game in replay_oldest_first(oldest_game['end_time']):
+        if not started:
+            if _gameId(tagged_game[0]) != oldest_game_id:
+                continue
+            started = True
+        yield tagged_game
+
+        num_games -= 1
+        if num_games == 0:
+            return
+
+def _streamGames(tagged_games_newest_first, replay_oldest_first, player_name, correct_elo, newest_first):
+    """
+    Yield the unfiltered games of a tagged run, applying elo correction as they stream.
+
+    Newest first streams in one pass. Oldest first needs a first pass to find the oldest game of the run and its
+    average abs elo change, which only keeps a few values, then replay_oldest_first(end_time) replays the candidate
+    games in chronological order starting no later than that game's end_time, and everything before it is skipped.
+    An average abs elo change that lands on a half replays the run once more to round it as the original loop does.
+    """
+    def replay_run(oldest_game, num_games):
+        return (archived_game for archived_game, _ in _replayRun(replay_oldest_first, oldest_game, num_games))
+
+    if newest_first:
+        tagged_games = _correctEloNewestFirst(tagged_games_newest_first, player_name, replay_run) if correct_elo else tagged_games_newest_first
+        for archived_game, filtered in tagged_games:
+            if not filtered:
+                # cached games are shared, so uncorrected games are copied too
+                yield archived_game if correct_elo else _copyForCorrection(archived_game)
+        return
+
+    num_games = 0
+    abs_elo_change_sum = 0
+    prev_player_elo = None
+    oldest_game = None
+
+    for archived_game, _ in tagged_games_newest_first:
+        num_games += 1
+        oldest_game = archived_game
+
+        if correct_elo:
+            player_elo = get_elo(archived_game, player_name)['Player']
+            if prev_player_elo is not None:
+                abs_elo_change_sum += abs(prev_player_elo - player_elo)
+            prev_player_elo = player_elo
+
+    if num_games == 0:
+        return
+
+    tagged_games = _replayRun(replay_oldest_first, oldest_game, num_games)
+    if correct_elo and num_games >= 2:
+        replay_abs_elo_changes = lambda: _absEloChanges(replay_run(oldest_game, num_games), player_name)
+        average_abs_elo_change = _streamedAverageAbsEloChange(abs_elo_change_sum, num_games - 1, replay_abs_elo_changes)
+        tagged_games = _correctEloChronological(tagged_games, player_name, average_abs_elo_change)
     else:
-        if won == 1:
-            first_game['white']['rating'] += average_abs_elo_change
-            first_game['black']['rating'] -= average_abs_elo_change
-        else:
-            first_game['white']['rating'] -= average_abs_elo_change
-            first_game['black']['rating'] += average_abs_elo_change
+        tagged_games = ((_copyForCorrection(archived_game), filtered) for archived_game, filtered in tagged_games)
+
+    for archived_game, filtered in tagged_games:
+        if not filtered:
+            yield archived_game
+
+def iter_most_recent_games(player_name, num_games=100, time_class='rapid', filter_func=None, correct_elo=True, max_games_searched=None, newest_first=False, prefetch_months=None, max_workers=4):
+    """
+    Generator version of get_most_recent_games. Games are yielded one at a time and month archives are only
+    read until the limits are hit, so memory stays bounded however many months a player has.
+
+    Parameters:
+    - player_name (str): The player's username on chess.com
+    - num_games (int): The amount of games to yield. Default 100.
+    - time_class (string): The name of the time class ('bullet', 'blitz', 'rapid') of chess games to pull from. Default 'rapid'.
+    - filter_func (function): A function that takes a game as input and returns True if the game should be included. Default None.
+    - correct_elo (bool): Toggle the correction of chess.com post-game ratings to pre-game ratings. Default True.
+    - max_games_searched (int): Maximum number of games the search should internally consider, None will search (num_games * 10) times. Default None.
+    - newest_first (bool): Yield the most recent game first instead of in chronological order. Chronological order reads the months twice. Default False.
+    - prefetch_months (int): Download this many months ahead of the search concurrently in one batch, None downloads one month at a time. Default None.
+    - max_workers (int): Number of concurrent downloads used when prefetching. Default 4.
+
+    Yields:
+    - dict: The same archived games get_most_recent_games returns, in the requested order.
+    """
+    if max_games_searched == None:
+        max_games_searched = num_games * 10
+
+    monthly_archived_list = _getMonthlyArchivesList(player_name)
+
+    def tagged_newest_first():
+        candidates = _iterRecentGamesNewestFirst(monthly_archived_list, time_class, max_games_searched, prefetch_months, max_workers)
+        return _tagFilteredGames(candidates, filter_func, num_games)
+
+    def replay_oldest_first(boundary_unix):
+        month_list = _filterOutArchiveListBeforeUnixTimestamp(monthly_archived_list, boundary_unix)
+        # the search itself walks month archives, so the replay has to follow the same order
+        candidates = _iterGamesInWindow(player_name, month_list, float('-inf'), float('inf'), time_class, newest_first=False, use_queries=False)
+        return _tagFilteredGames(candidates, filter_func)
 
-def get_most_recent_games(player_name, num_games=100, time_class='rapid', filter_func=None, correct_elo=True, max_games_searched=None):
+    return _streamGames(tagged_newest_first(), replay_oldest_first, player_name, correct_elo, newest_first)
+
+def get_most_recent_games(player_name, num_games=100, time_class='rapid', filter_func=None, correct_elo=True, max_games_searched=None, prefetch_months=None, max_workers=4):
     """
     Retrieve a list of archived games most recent to a player.
 
@@ -230,60 +1549,69 @@ def get_most_recent_games(player_name, num_games=100, time_class='rapid', filter
     - filter_func (function): A function that takes a game as input and returns True if the game should be included. Default None.
     - correct_elo (bool): Toggle the correction of chess.com post-game ratings to pre-game ratings. Default True.
     - max_games_searched (int): Maximum number of games the search should internally consider, None will search (num_games * 10) times. Default None.
+    - prefetch_months (int): Download this many months ahead of the search concurrently in one batch, None downloads one month at a time. Default None.
+    - max_workers (int): Number of concurrent downloads used when prefetching. Default 4.
 
     Returns:
     - list: The list of most recent archived games.
     """
     if max_games_searched == None:
         max_games_searched = num_games * 10
-    games_searched = 0
 
     monthly_archived_list = _getMonthlyArchivesList(player_name)
 
-    recent_archived_games = []
-    num_unfiltered = 0
-
-    for i in range(len(monthly_archived_list)):
-        month_url = monthly_archived_list[-(i+1)]
-        archived_games = _getArchivedGames(month_url)
+    candidates = _iterRecentGamesNewestFirst(monthly_archived_list, time_class, max_games_searched, prefetch_months, max_workers)
+    return _collectGames(_tagFilteredGames(candidates, filter_func, num_games), player_name, correct_elo)
 
-        for j in range(len(archived_games)):
-            if num_unfiltered == num_games or games_searched == max_games_searched:
-                break
+def _monthsInWindow(player_name, start_unix, end_unix):
+    monthly_archived_list = _getMonthlyArchivesList(player_name)
+    monthly_archived_list = _filterOutArchiveListAfterUnixTimestamp(monthly_archived_list, end_unix)
+    monthly_archived_list = _filterOutArchiveListBeforeUnixTimestamp(monthly_archived_list, start_unix)
+    return monthly_archived_list
 
-            archived_game = archived_games[-(j+1)]
-            games_searched += 1
+def iter_games_between_timestamps(player_name, start_unix, end_unix, time_class='rapid', filter_func=None, correct_elo=True, max_games=None, newest_first=False, prefetch=False, max_workers=4):
+    """
+    Generator version of get_games_between_timestamps. Games are yielded one at a time and month archives are only
+    read until max_games is hit, so memory stays bounded however long the window is.
 
-            if time_class is not None and archived_game['time_class'] != time_class:
-                continue
+    Parameters:
+    - player_name (str): The player's username on chess.com
+    - start_unix (int): The beginning timestamp, all games will be after this.
+    - end_unix (int): The end timestamp, all games will be before this.
+    - time_class (string): The name of the time class ('bullet', 'blitz', 'rapid') of chess games to pull from. Default 'rapid'.
+    - filter_func (function): A function that takes an archived game as input and returns True if the game should be included. Default None.
+    - correct_elo (bool): Toggle the correction of chess.com post-game ratings to pre-game ratings. Default True.
+    - max_games (int): Only yield the max_games most recent games of the window, None yields all of them. Default None.
+    - newest_first (bool): Yield the most recent game first instead of in chronological order. Chronological order with correct_elo or max_games reads the months twice. Default False.
+    - prefetch (bool): Download every month in the window concurrently before scanning. Default False.
+    - max_workers (int): Number of concurrent downloads used when prefetching. Default 4.
 
-            filtered = True if (filter_func and filter_func(archived_game) == False) else False
+    Yields:
+    - dict: The same archived games get_games_between_timestamps returns, in the requested order.
+    """
+    monthly_archived_list = _monthsInWindow(player_name, start_unix, end_unix)
 
-            recent_archived_games.append({
-                'game': archived_game,
-                'filtered': filtered
-            })
+    if prefetch:
+        prefetch_archived_games(monthly_archived_list, max_workers=max_workers)
 
-            if not filtered:
-                num_unfiltered += 1
+    predicate = _pushedDownPredicate(filter_func, correct_elo)
 
-        if num_unfiltered == num_games or games_searched == max_games_searched:
-                break
-    
-    recent_archived_games = list(reversed(recent_archived_games))
+    if not newest_first and not correct_elo and max_games is None:
+        candidates = _iterGamesInWindow(player_name, monthly_archived_list, start_unix, end_unix, time_class, newest_first=False, predicate=predicate)
+        return (_copyForCorrection(archived_game) for archived_game, filtered in _tagFilteredGames(candidates, filter_func) if not filtered)
 
-    games_list = [game_dict['game'] for game_dict in recent_archived_games]
+    def tagged_newest_first():
+        candidates = _iterGamesInWindow(player_name, monthly_archived_list, start_unix, end_unix, time_class, newest_first=True, predicate=predicate)
+        return _tagFilteredGames(candidates, filter_func, max_games)
 
-    if correct_elo:
-        _correct_archive_elo(games_list, player_name)
+    def replay_oldest_first(boundary_unix):
+        month_list = _filterOutArchiveListBeforeUnixTimestamp(monthly_archived_list, boundary_unix)
+        candidates = _iterGamesInWindow(player_name, month_list, start_unix, end_unix, time_class, newest_first=False, predicate=predicate)
+        return _tagFilteredGames(candidates, filter_func)
 
-    if filter_func != None:
-        filtered_list = [game_dict['game'] for game_dict in recent_archived_games if not game_dict['filtered']]
-        return filtered_list
-    else:
-        return games_list
+    return _streamGames(tagged_newest_first(), replay_oldest_first, player_name, correct_elo, newest_first)
 
-def get_games_between_timestamps(player_name, start_unix, end_unix, time_class='rapid', filter_func=None, verbose=False, correct_elo=True, max_games=None):
+def get_games_between_timestamps(player_name, start_unix, end_unix, time_class='rapid', filter_func=None, verbose=False, correct_elo=True, max_games=None, prefetch=False, max_workers=4):
     """
     Retrieve a list of all of a player's archived games between two unix timestamps.
 
@@ -294,6 +1622,8 @@ def get_games_between_timestamps(player_name, start_unix, end_unix, time_class='
     - time_class (string): The name of the time class ('bullet', 'blitz', 'rapid') of chess games to pull from. Default 'rapid'.
     - filter_func (function): A function that takes an archived game as input and returns True if the game should be included. Default None.
     - correct_elo (bool): Toggle the correction of chess.com post-game ratings to pre-game ratings. Default True.
+    - prefetch (bool): Download every month in the window concurrently before scanning. With max_games set this may download months that end up unused. Default False.
+    - max_workers (int): Number of concurrent downloads used when prefetching. Default 4.
 
     Returns:
     - list: The list of archived games between the two unix timestamps.
@@ -301,58 +1631,185 @@ def get_games_between_timestamps(player_name, start_unix, end_unix, time_class='
     if verbose:
         print(f"Scanning games from {player_name} from {start_unix} to {end_unix}")
 
-    monthly_archived_list = _getMonthlyArchivesList(player_name)
-    monthly_archived_list = _filterOutArchiveListAfterUnixTimestamp(monthly_archived_list, end_unix)
-    monthly_archived_list = _filterOutArchiveListBeforeUnixTimestamp(monthly_archived_list, start_unix)
-
-    recent_archived_games = []
-    num_unfiltered = 0
-
-    for i in range(len(monthly_archived_list)):
-        if max_games is not None and num_unfiltered == max_games:
-            break
-
-        month_url = monthly_archived_list[-(i+1)]
-        archived_games = _getArchivedGames(month_url)
+    monthly_archived_list = _monthsInWindow(player_name, start_unix, end_unix)
 
-        for j in range(len(archived_games)):
-            archived_game = archived_games[-(j+1)]
-            
-            if verbose:
-                print(archived_game['end_time'], archived_game['white']['username'], "v.s.", archived_game['black']['username'])
+    if prefetch:
+        prefetch_archived_games(monthly_archived_list, max_workers=max_workers)
 
-            unix_timestamp = archived_game['end_time']
-            if unix_timestamp > end_unix or unix_timestamp < start_unix:
-                continue
+    predicate = _pushedDownPredicate(filter_func, correct_elo)
+    candidates = _iterGamesInWindow(player_name, monthly_archived_list, start_unix, end_unix, time_class, newest_first=True, verbose=verbose, predicate=predicate)
+    return _collectGames(_tagFilteredGames(candidates, filter_func, max_games), player_name, correct_elo)
 
-            if time_class is not None and archived_game['time_class'] != time_class:
-                continue
+## Player histories
+# Many queries against the same player's history, like the 30 day window before each game of an opponent,
+# are answered from sorted end_time arrays with binary search instead of a month scan per query.
+class PlayerHistory:
+    """
+    A player's games of one time class, loaded once in month archive order. Every query returns
+    exactly what get_games_between_timestamps returns for the same arguments, as long as the window
+    lies inside the loaded range. Queries return copies, self.games holds the cached games themselves and is read-only.
 
-            filtered = True if (filter_func and filter_func(archived_game) == False) else False
+    When the games are sorted by end_time, as chess.com month archives normally are, window bounds come from binary
+    search. Otherwise each window is selected with a mask over the end times, in archive order like the window scan.
 
-            recent_archived_games.append({
-                'game': archived_game,
-                'filtered': filtered
-            })
+    Use load_player_history to build one from the cache.
+    """
 
-            if not filtered:
-                num_unfiltered += 1
+    def __init__(self, player_name, archived_games, filter_func=None):
+        self.player_name = player_name
+        self.games = list(archived_games)
+        self.end_times = np.array([archived_game['end_time'] for archived_game in self.games], dtype=np.int64)
+        self.sorted = bool(np.all(self.end_times[1:] >= self.end_times[:-1]))
 
-                if max_games is not None and num_unfiltered == max_games:
-                    break
-    
-    recent_archived_games = list(reversed(recent_archived_games))
+        if filter_func is None:
+            kept = np.ones(len(self.games), dtype=bool)
+        elif isinstance(filter_func, ArchiveFilter):
+            kept = filter_func.mask(self.games)
+        else:
+            kept = np.array([filter_func(archived_game) != False for archived_game in self.games], dtype=bool)
+        self.kept = kept
+        self.kept_indices = np.flatnonzero(kept)
+
+        self._white_elo = np.array([archived_game['white']['rating'] for archived_game in self.games], dtype=np.int64)
+        self._black_elo = np.array([archived_game['black']['rating'] for archived_game in self.games], dtype=np.int64)
+        self._is_white = np.array([get_color(archived_game, player_name) for archived_game in self.games], dtype=bool)
+        self._won = np.array([get_won(archived_game, player_name) for archived_game in self.games], dtype=np.float64)
+
+    def __len__(self):
+        return len(self.games)
+
+    def window_bounds(self, start_unix, end_unix, max_games=None):
+        """
+        Index range of the games a window query runs elo correction over, for one window or arrays of windows.
+        Only for histories sorted by end_time (self.sorted).
+
+        Parameters:
+        - start_unix (int or array): Window starts, inclusive.
+        - end_unix (int or array): Window ends, inclusive.
+        - max_games (int): Stop at the max_games most recent games that pass the filter. Default None.
+
+        Returns:
+        - tuple: (first, last) index arrays (or ints), self.games[first:last] holds the window's games oldest first,
+          including games rejected by the filter.
+        """
+        if not self.sorted:
+            raise ValueError(f'Games of {self.player_name} are not sorted by end_time, windows are not index ranges')
+
+        first = np.searchsorted(self.end_times, start_unix, side='left')
+        last = np.searchsorted(self.end_times, end_unix, side='right')
+
+        if max_games is not None:
+            # the max_games-th most recent kept game before last, when the window holds that many
+            num_kept_before_last = np.searchsorted(self.kept_indices, last, side='left')
+            num_kept_in_window = num_kept_before_last - np.searchsorted(self.kept_indices, first, side='left')
+            if max_games == 0:
+                first = last
+            elif len(self.kept_indices) > 0:
+                cutoff = self.kept_indices[np.maximum(num_kept_before_last - max_games, 0)]
+                first = np.where(num_kept_in_window >= max_games, cutoff, first)
+
+        return first, last
+
+    def _windows(self, start_unix, end_unix, max_games):
+        # games each window query runs elo correction over, oldest first: slices when sorted, index arrays otherwise
+        start_unix = np.atleast_1d(np.asarray(start_unix, dtype=np.int64))
+        end_unix = np.atleast_1d(np.asarray(end_unix, dtype=np.int64))
+        if self.sorted:
+            firsts, lasts = self.window_bounds(start_unix, end_unix, max_games)
+            return [slice(int(first), int(last)) for first, last in zip(firsts, lasts)]
+
+        windows = []
+        for start, end in zip(start_unix, end_unix):
+            indices = np.flatnonzero((self.end_times >= start) & (self.end_times <= end))
+            if max_games is not None:
+                kept_positions = np.flatnonzero(self.kept[indices])
+                if max_games == 0:
+                    indices = indices[:0]
+                elif len(kept_positions) >= max_games:
+                    indices = indices[kept_positions[-max_games]:]
+            windows.append(indices)
+        return windows
+
+    def _corrected(self, window, correct_elo):
+        positions = range(len(self.games))[window] if isinstance(window, slice) else window
+        if not correct_elo or len(positions) < 2:
+            return [_copyForCorrection(self.games[i]) for i in positions if self.kept[i]]
+
+        white_elo, black_elo = correct_elo_columns(self._white_elo[window], self._black_elo[window], self._is_white[window], self._won[window])
+        return [_withRatings(self.games[i], white_elo[j], black_elo[j]) for j, i in enumerate(positions) if self.kept[i]]
+
+    def games_between(self, start_unix, end_unix, max_games=None, correct_elo=True):
+        """
+        Same result as get_games_between_timestamps for the player, time class and filter of this history.
+        """
+        return self._corrected(self._windows(start_unix, end_unix, max_games)[0], correct_elo)
+
+    def games_before(self, end_unix, num_games, lookback=None, correct_elo=True):
+        """
+        The last num_games games passing the filter that ended at or before end_unix, within lookback seconds if given.
+        """
+        start_unix = np.iinfo(np.int64).min if lookback is None else end_unix - lookback
+        return self.games_between(start_unix, end_unix, max_games=num_games, correct_elo=correct_elo)
+
+    def bulk_games_between(self, start_unix, end_unix, max_games=None, correct_elo=True):
+        """
+        games_between for many windows at once, e.g. the 30 day window before every game played against this player.
+
+        Parameters:
+        - start_unix (array-like): Window starts.
+        - end_unix (array-like): Window ends.
+        - max_games (int): Stop at the max_games most recent games that pass the filter. Default None.
+        - correct_elo (bool): Toggle the correction of post-game ratings to pre-game ratings. Default True.
+
+        Returns:
+        - list: One list of archived games per window.
+        """
+        return [self._corrected(window, correct_elo) for window in self._windows(start_unix, end_unix, max_games)]
+
+    def bulk_player_elo(self, start_unix, end_unix, max_games=None, correct_elo=True):
+        """
+        The player's rating in each window's games, as get_elo(game, player)['Player'] over bulk_games_between,
+        without building any game dictionaries.
+
+        Returns:
+        - list: One int64 array per window, oldest game first.
+        """
+        player_elo = np.where(self._is_white, self._white_elo, self._black_elo)
+
+        elos = []
+        for window in self._windows(start_unix, end_unix, max_games):
+            window_kept = self.kept[window]
+            if correct_elo and len(window_kept) >= 2:
+                white_elo, black_elo = correct_elo_columns(self._white_elo[window], self._black_elo[window], self._is_white[window], self._won[window])
+                window_elo = np.where(self._is_white[window], white_elo, black_elo)
+            else:
+                window_elo = player_elo[window]
+            elos.append(window_elo[window_kept])
+        return elos
+
+def load_player_history(player_name, start_unix, end_unix, time_class='rapid', filter_func=None, prefetch=False, max_workers=4):
+    """
+    Read a player's games between two timestamps once, for many window queries inside that range.
 
-    games_list = [game_dict['game'] for game_dict in recent_archived_games]
+    Parameters:
+    - player_name (str): The player's username on chess.com
+    - start_unix (int): The earliest window start that will be queried.
+    - end_unix (int): The latest window end that will be queried.
+    - time_class (string): The name of the time class ('bullet', 'blitz', 'rapid') of chess games to pull from. Default 'rapid'.
+    - filter_func (function): A function that takes an archived game as input and returns True if the game should be included. Default None.
+    - prefetch (bool): Download every month in the range concurrently before reading. Default False.
+    - max_workers (int): Number of concurrent downloads used when prefetching. Default 4.
 
-    if correct_elo:
-        _correct_archive_elo(games_list, player_name)
+    Returns:
+    - PlayerHistory: The history, queried with games_between, games_before or their bulk forms.
+    """
+    monthly_archived_list = _monthsInWindow(player_name, start_unix, end_unix)
+    if prefetch:
+        prefetch_archived_games(monthly_archived_list, max_workers=max_workers)
 
-    if filter_func != None:
-        filtered_list = [game_dict['game'] for game_dict in recent_archived_games if not game_dict['filtered']]
-        return filtered_list
-    else:
-        return games_list
+    # the history only hands out copies, so it can hold the cached games themselves
+    archived_games = list(_iterGamesInWindow(player_name, monthly_archived_list, start_unix, end_unix, time_class, newest_first=False))
+    return PlayerHistory(player_name, archived_games, filter_func)
 
 def get_opponent_name(archived_game, player_name):
     """
@@ -366,15 +1823,12 @@ def get_opponent_name(archived_game, player_name):
     - str: Username string of the opponent name.
     """
 
-    white_username = archived_game['white']['username']
-    black_username = archived_game['black']['username']
+    is_white = _playerIsWhite(archived_game, player_name)
 
-    if _case_insensitive_match(white_username, player_name):
-        return black_username
-    elif _case_insensitive_match(black_username, player_name):
-        return white_username
-    
-    raise ValueError(f'Player name {player_name} not found in archived game')
+    if is_white is None:
+        raise ValueError(f'Player name {player_name} not found in archived game')
+
+    return archived_game['black' if is_white else 'white']['username']
 
 def get_accuracy(archived_game, player_name):
     """
@@ -392,30 +1846,20 @@ def get_accuracy(archived_game, player_name):
     or None if accuracies not available for this game.
     """
 
-    white_player = archived_game['white']['username']
-    black_player = archived_game['black']['username']
-
     if 'accuracies' not in archived_game:
         return None
 
+    is_white = _playerIsWhite(archived_game, player_name)
+
+    if is_white is None:
+        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
+
     white_acc = archived_game['accuracies']['white']
     black_acc = archived_game['accuracies']['black']
 
-    player_acc = 0
-    opponent_acc = 0
-
-    if _case_insensitive_match(white_player, player_name):
-        player_acc = white_acc
-        opponent_acc = black_acc
-    elif _case_insensitive_match(black_player, player_name):
-        player_acc = black_acc
-        opponent_acc = white_acc
-    else:
-        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
-    
     return {
-        'Player': player_acc,
-        'Opponent': opponent_acc
+        'Player': white_acc if is_white else black_acc,
+        'Opponent': black_acc if is_white else white_acc
     }
 
 def get_elo(archived_game, player_name):
@@ -433,39 +1877,26 @@ def get_elo(archived_game, player_name):
     }
     """
 
-    white_player = archived_game['white']['username']
-    black_player = archived_game['black']['username']
+    is_white = _playerIsWhite(archived_game, player_name)
+
+    if is_white is None:
+        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
 
     white_elo = archived_game['white']['rating']
     black_elo = archived_game['black']['rating']
 
-    player_elo = 0
-    opponent_elo = 0
-
-    if _case_insensitive_match(white_player, player_name):
-        player_elo = white_elo
-        opponent_elo = black_elo
-    elif _case_insensitive_match(black_player, player_name):
-        player_elo = black_elo
-        opponent_elo = white_elo
-    else:
-        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
-    
     return {
-        'Player': player_elo,
-        'Opponent': opponent_elo
+        'Player': white_elo if is_white else black_elo,
+        'Opponent': black_elo if is_white else white_elo
     }
 
 def get_color(archived_game, player_name):
-    white_player = archived_game['white']['username']
-    black_player = archived_game['black']['username']
+    is_white = _playerIsWhite(archived_game, player_name)
 
-    if _case_insensitive_match(white_player, player_name):
-        return True
-    elif _case_insensitive_match(black_player, player_name):
-        return False
-    
-    raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
+    if is_white is None:
+        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
+
+    return is_white
 
 def get_won(archived_game, player_name):
     """
@@ -479,57 +1910,339 @@ def get_won(archived_game, player_name):
     - int: 1 if won, 0 if lost, or None if draw
     """
 
-    white_player = archived_game['white']['username']
-    black_player = archived_game['black']['username']
+    is_white = _playerIsWhite(archived_game, player_name)
 
-    white_result = archived_game['white']['result']
-    black_result = archived_game['black']['result']
+    if is_white is None:
+        raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
 
-    if _case_insensitive_match(white_player, player_name):
-        if white_result == 'win':
-            return 1
-        elif black_result == 'win':
-            return 0
-        else:
-            return None
-    elif _case_insensitive_match(black_player, player_name):
-        if white_result == 'win':
-            return 0
-        elif black_result == 'win':
-            return 1
+    if archived_game['white']['result'] == 'win':
+        return 1 if is_white else 0
+    elif archived_game['black']['result'] == 'win':
+        return 0 if is_white else 1
+    else:
+        return None
+
+## Batch accessors
+# Column versions of the accessors above for a whole list of games, filled in one pass without per-game dicts.
+def get_game_columns(archived_games, player_name, as_dataframe=False):
+    """
+    Get the accessor values of every game in a list as columns.
+
+    Parameters:
+    - archived_games (list): The archived game dictionaries.
+    - player_name (str): The perspective player, who must play in every game.
+    - as_dataframe (bool): Return a pandas DataFrame instead of a dictionary of numpy arrays. Default False.
+
+    Returns:
+    - dict: {
+        'end_time': int64 game end timestamps.
+        'is_white': True where the player had white (get_color).
+        'player_elo': int64 ratings of the player (get_elo 'Player').
+        'opponent_elo': int64 ratings of the opponent (get_elo 'Opponent').
+        'won': int8, 1 where the player won, 0 where they lost or drew (get_won).
+        'draw': True where neither player won, the mask for get_won returning None.
+        'player_accuracy': float64 accuracies of the player, nan where missing (get_accuracy 'Player').
+        'opponent_accuracy': float64 accuracies of the opponent, nan where missing (get_accuracy 'Opponent').
+        'has_accuracies': True where the game has accuracies, the mask for get_accuracy returning None.
+        'opponent_name': Opponent usernames (get_opponent_name).
+    }
+    or a DataFrame with these columns.
+    """
+    canonical_name = _canonicalName(player_name)
+
+    end_times, is_white = [], []
+    white_elos, black_elos = [], []
+    white_results, black_results = [], []
+    white_accuracies, black_accuracies, has_accuracies = [], [], []
+    white_names, black_names = [], []
+
+    for archived_game in archived_games:
+        white, black = archived_game['white'], archived_game['black']
+        white_username, black_username = white['username'], black['username']
+
+        if (_canonical_names.get(white_username) or _canonicalName(white_username)) is canonical_name:
+            is_white.append(True)
+        elif (_canonical_names.get(black_username) or _canonicalName(black_username)) is canonical_name:
+            is_white.append(False)
         else:
-            return None
+            raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
+
+        end_times.append(archived_game['end_time'])
+        white_elos.append(white['rating'])
+        black_elos.append(black['rating'])
+        white_results.append(white['result'] == 'win')
+        black_results.append(black['result'] == 'win')
+        white_names.append(white_username)
+        black_names.append(black_username)
+
+        accuracies = archived_game.get('accuracies')
+        has_accuracies.append(accuracies is not None)
+        white_accuracies.append(accuracies['white'] if accuracies is not None else None)
+        black_accuracies.append(accuracies['black'] if accuracies is not None else None)
+
+    is_white = np.array(is_white, dtype=bool)
+    white_elos = np.array(white_elos, dtype=np.int64)
+    black_elos = np.array(black_elos, dtype=np.int64)
+    white_won = np.array(white_results, dtype=bool)
+    black_won = np.array(black_results, dtype=bool)
+    white_accuracies = np.array(white_accuracies, dtype=np.float64)
+    black_accuracies = np.array(black_accuracies, dtype=np.float64)
+    white_names = np.array(white_names, dtype=object)
+    black_names = np.array(black_names, dtype=object)
+
+    columns = {
+        'end_time': np.array(end_times, dtype=np.int64),
+        'is_white': is_white,
+        'player_elo': np.where(is_white, white_elos, black_elos),
+        'opponent_elo': np.where(is_white, black_elos, white_elos),
+        'won': np.where(is_white, white_won, ~white_won & black_won).astype(np.int8),
+        'draw': ~(white_won | black_won),
+        'player_accuracy': np.where(is_white, white_accuracies, black_accuracies),
+        'opponent_accuracy': np.where(is_white, black_accuracies, white_accuracies),
+        'has_accuracies': np.array(has_accuracies, dtype=bool),
+        'opponent_name': np.where(is_white, black_names, white_names)
+    }
 
-    raise ValueError(f"Player name '{player_name}' does not match either player in the game.")
+    if as_dataframe:
+        # imported here, pandas alone would more than double the import time of this module
+        try:
+            import pandas as pd
+        except ImportError:
+            raise ImportError("as_dataframe needs the pandas package installed.")
+        return pd.DataFrame(columns)
 
-def build_archive_filter(rated=None, has_accuracies=None, exclude_draws=None, max_elo_diff=None, rules='chess'):
-    def filter_func(archived_game):
-        if max_elo_diff is not None:
-            elo_diff = archived_game['white']['rating'] - archived_game['black']['rating']
-            if abs(elo_diff) > max_elo_diff:
-                return False
+    return columns
 
-        if has_accuracies is not None:
-            if 'accuracies' not in archived_game and has_accuracies:
-                return False
-            elif 'accuracies' in archived_game and not has_accuracies:
-                return False
+def get_elo_batch(archived_games, player_name):
+    """
+    get_elo for a list of games, returns {'Player': int64 array, 'Opponent': int64 array}.
+    """
+    columns = get_game_columns(archived_games, player_name)
+    return {'Player': columns['player_elo'], 'Opponent': columns['opponent_elo']}
 
-        if rated is not None and archived_game.get('rated') != rated:
-            return False
+def get_won_batch(archived_games, player_name):
+    """
+    get_won for a list of games, returns an int8 masked array with draws masked.
+    """
+    columns = get_game_columns(archived_games, player_name)
+    return np.ma.masked_array(columns['won'], mask=columns['draw'])
 
-        if exclude_draws is not None:
-            white_result = archived_game.get('white', {}).get('result')
-            black_result = archived_game.get('black', {}).get('result')
-            if white_result != "win" and black_result != "win":
-                return False
+def get_color_batch(archived_games, player_name):
+    """
+    get_color for a list of games, returns a bool array that is True where the player had white.
+    """
+    return get_game_columns(archived_games, player_name)['is_white']
+
+def get_accuracy_batch(archived_games, player_name):
+    """
+    get_accuracy for a list of games, returns {'Player': float64 masked array, 'Opponent': float64 masked array}
+    with the games without accuracies masked.
+    """
+    columns = get_game_columns(archived_games, player_name)
+    missing = ~columns['has_accuracies']
+    return {
+        'Player': np.ma.masked_array(columns['player_accuracy'], mask=missing),
+        'Opponent': np.ma.masked_array(columns['opponent_accuracy'], mask=missing)
+    }
 
-        if rules is not None and archived_game.get('rules') != rules:
+def get_opponent_name_batch(archived_games, player_name):
+    """
+    get_opponent_name for a list of games, returns an object array of usernames.
+    """
+    return get_game_columns(archived_games, player_name)['opponent_name']
+
+## Game filters
+@functools.lru_cache(maxsize=1024)
+def parse_time_control(time_control):
+    """
+    (base seconds, increment seconds) of a time control like '600', '600+5' or '1/86400' (daily), None if unknown.
+    """
+    if not time_control or time_control == '-':
+        return None
+    if '/' in time_control:
+        return int(time_control.split('/')[1]), 0
+    base, _, increment = time_control.partition('+')
+    return int(base), int(increment or 0)
+
+class ArchiveFilter:
+    """
+    Declarative game filter. The spec is compiled three ways:
+    - calling the filter on a game runs only the checks in the spec, so it can be passed anywhere a filter_func is expected;
+    - mask(games) evaluates it over columns for a whole batch of games at once;
+    - sql_predicate() pushes it down into SqliteArchiveStore.query_games as a WHERE clause.
+
+    Parameters:
+    - rated (bool): Only rated (True) or unrated (False) games. Default None.
+    - has_accuracies (bool): Only games with (True) or without (False) accuracies, 'accuracies': None counts as without. Default None.
+    - exclude_draws (bool): Drop games that neither player won. Default None.
+    - max_elo_diff (int): Largest allowed absolute rating difference between the players. Default None.
+    - rules (str): Only games with these rules. Default 'chess'.
+    - time_class (str or list): Only games of these time classes. Default None.
+    - min_base_time, max_base_time (int): Range of the time control's base time in seconds, per move for daily games. Default None.
+    - min_increment, max_increment (int): Range of the time control's increment in seconds. Default None.
+    """
+
+    def __init__(self, rated=None, has_accuracies=None, exclude_draws=None, max_elo_diff=None, rules='chess',
+                 time_class=None, min_base_time=None, max_base_time=None, min_increment=None, max_increment=None):
+        self.rated = rated
+        self.has_accuracies = has_accuracies
+        self.exclude_draws = exclude_draws
+        self.max_elo_diff = max_elo_diff
+        self.rules = rules
+        self.time_classes = None if time_class is None else frozenset([time_class] if isinstance(time_class, str) else time_class)
+        self.base_time_range = (min_base_time, max_base_time)
+        self.increment_range = (min_increment, max_increment)
+        self._checks = self._compile()
+
+    def _timeControlInRange(self, time_control):
+        parsed = parse_time_control(time_control)
+        if parsed is None:
             return False
 
+        for value, (low, high) in zip(parsed, (self.base_time_range, self.increment_range)):
+            if (low is not None and value < low) or (high is not None and value > high):
+                return False
         return True
 
-    return filter_func
+    def _hasTimeControlRange(self):
+        return any(bound is not None for bound in self.base_time_range + self.increment_range)
+
+    def _compile(self):
+        # one check per condition in the spec, in the same order as the original closure of build_archive_filter
+        checks = []
+        if self.max_elo_diff is not None:
+            max_elo_diff = self.max_elo_diff
+            checks.append(lambda g: abs(g['white']['rating'] - g['black']['rating']) <= max_elo_diff)
+        if self.has_accuracies is not None:
+            has_accuracies = self.has_accuracies
+            checks.append(lambda g: (g.get('accuracies') is not None) == has_accuracies)
+        if self.rated is not None:
+            rated = self.rated
+            checks.append(lambda g: g.get('rated') == rated)
+        if self.exclude_draws is not None:
+            checks.append(lambda g: g.get('white', {}).get('result') == 'win' or g.get('black', {}).get('result') == 'win')
+        if self.rules is not None:
+            rules = self.rules
+            checks.append(lambda g: g.get('rules') == rules)
+        if self.time_classes is not None:
+            time_classes = self.time_classes
+            checks.append(lambda g: g.get('time_class') in time_classes)
+        if self._hasTimeControlRange():
+            checks.append(lambda g: self._timeControlInRange(g.get('time_control')))
+        return checks
+
+    def __call__(self, archived_game):
+        return all(check(archived_game) for check in self._checks)
+
+    ## columnar evaluation
+    COLUMNS = ('white_rating', 'black_rating', 'white_result', 'black_result', 'white_accuracy', 'rated', 'rules', 'time_class', 'time_control')
+
+    @staticmethod
+    def columns_of(archived_games):
+        """
+        Extract the columns the filter reads from a list of games, named like archive_export.GAMES_SCHEMA.
+        """
+        columns = {name: [] for name in ArchiveFilter.COLUMNS}
+        for archived_game in archived_games:
+            white, black = archived_game['white'], archived_game['black']
+            accuracies = archived_game.get('accuracies')
+            columns['white_rating'].append(white['rating'])
+            columns['black_rating'].append(black['rating'])
+            columns['white_result'].append(white.get('result'))
+            columns['black_result'].append(black.get('result'))
+            columns['white_accuracy'].append(np.nan if accuracies is None else accuracies.get('white', np.nan))
+            columns['rated'].append(archived_game.get('rated'))
+            columns['rules'].append(archived_game.get('rules'))
+            columns['time_class'].append(archived_game.get('time_class'))
+            columns['time_control'].append(archived_game.get('time_control'))
+        return columns
+
+    def mask(self, games):
+        """
+        Evaluate the filter over a batch of games at once.
+
+        Parameters:
+        - games (list or mapping): Archived games, or columns named like archive_export.GAMES_SCHEMA
+          (a dictionary of arrays, a pandas DataFrame or a pyarrow Table, e.g. from archive_export.read_games_table).
+
+        Returns:
+        - numpy.ndarray: Boolean mask, True for the games the filter keeps.
+        """
+        if isinstance(games, list):
+            games = self.columns_of(games)
+
+        def column(name, dtype=object):
+            values = games[name]
+            if hasattr(values, 'to_numpy'):
+                values = values.to_numpy()
+            return np.asarray(values, dtype=dtype)
+
+        keep = np.ones(len(column('white_rating', np.float64)), dtype=bool)
+
+        if self.max_elo_diff is not None:
+            keep &= np.abs(column('white_rating', np.float64) - column('black_rating', np.float64)) <= self.max_elo_diff
+        if self.has_accuracies is not None:
+            has_accuracies = ~np.isnan(column('white_accuracy', np.float64))
+            keep &= has_accuracies if self.has_accuracies else ~has_accuracies
+        if self.rated is not None:
+            keep &= column('rated') == self.rated
+        if self.exclude_draws is not None:
+            keep &= (column('white_result') == 'win') | (column('black_result') == 'win')
+        if self.rules is not None:
+            keep &= column('rules') == self.rules
+        if self.time_classes is not None:
+            keep &= np.isin(column('time_class'), list(self.time_classes))
+        if self._hasTimeControlRange():
+            keep &= np.fromiter((self._timeControlInRange(time_control) for time_control in column('time_control')), dtype=bool, count=len(keep))
+
+        return keep
+
+    ## store push down
+    def sql_predicate(self):
+        """
+        WHERE clause over SqliteArchiveStore's games and game_bodies tables for the parts of the filter sqlite can evaluate.
+        Time control ranges are not pushed down, rows still have to pass the filter itself.
+
+        Returns:
+        - tuple: (sql, params), sql is '' when nothing can be pushed down.
+        """
+        clauses, params = [], []
+        if self.max_elo_diff is not None:
+            clauses.append("abs(json_extract(game_bodies.game, '$.white.rating') - json_extract(game_bodies.game, '$.black.rating')) <= ?")
+            params.append(self.max_elo_diff)
+        if self.has_accuracies is not None:
+            clauses.append(f"coalesce(json_type(game_bodies.game, '$.accuracies'), 'null') {'!=' if self.has_accuracies else '='} 'null'")
+        if self.rated is not None:
+            clauses.append('rated = ?')
+            params.append(int(self.rated))
+        if self.exclude_draws is not None:
+            clauses.append("(json_extract(game_bodies.game, '$.white.result') = 'win' OR json_extract(game_bodies.game, '$.black.result') = 'win')")
+        if self.rules is not None:
+            clauses.append("json_extract(game_bodies.game, '$.rules') = ?")
+            params.append(self.rules)
+        if self.time_classes is not None:
+            clauses.append(f"time_class IN ({', '.join('?' * len(self.time_classes))})")
+            params.extend(sorted(self.time_classes))
+
+        return ' AND '.join(clauses), params
+
+def build_archive_filter(rated=None, has_accuracies=None, exclude_draws=None, max_elo_diff=None, rules='chess',
+                         time_class=None, min_base_time=None, max_base_time=None, min_increment=None, max_increment=None):
+    """
+    Build a filter_func for the game retrieval functions, see ArchiveFilter for the parameters.
+    """
+    return ArchiveFilter(
+        rated=rated,
+        has_accuracies=has_accuracies,
+        exclude_draws=exclude_draws,
+        max_elo_diff=max_elo_diff,
+        rules=rules,
+        time_class=time_class,
+        min_base_time=min_base_time,
+        max_base_time=max_base_time,
+        min_increment=min_increment,
+        max_increment=max_increment
+    )
 
 def simplified_archived_game(archived_game):
     date_time = datetime.datetime.fromtimestamp(archived_game['end_time'])
@@ -0,0 +1,337 @@
+# dataset_builder.py
+# Builds the training datasets of the dataset building notebooks from the command line, one player per process
+#
+# Every player is a shard: a worker process fetches the player's games in the window, the opponents' recent
+# histories, computes the feature rows and writes <shard_dir>/<player>.<params hash>.<format> (temp file + rename).
+# Shards built with the same parameters are reused, so an interrupted build resumes where it stopped. The shards are
+# then merged in player list order into the output file.
+#
+# The 'base' feature set has exactly the columns of dataset_2277.csv (dataset_building.ipynb) and
+# 'combined' those of dataset_tyler_combined_match_1753.csv (dataset_building_tyler.ipynb).
+#
+# Usage:
+#   python dataset_builder.py --players BIG_TONKA_T Andymcg12345 --start 1696176000 --end 1698768000 --out dataset.csv --workers 8
+#   python dataset_builder.py --players-file players.txt --start 1696176000 --end 1701363600 --features combined \
+#       --include-draws --max-games none --opp-include-draws --out combined.csv
+
+import argparse
+import hashlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import archive_store
+import archives_manager
+import game_features
+
+
+FEATURE_SETS = {
+    'base': [
+        'player_name', 'opp_name', 'player_elo', 'opp_elo', 'elo_diff', 'color',
+        'x-ma5', 'x-ma20', 'opp_x-ma5', 'opp_x-ma20', 'won'
+    ],
+    'combined': [
+        'unix', 'player_name', 'opp_name', 'player_elo', 'opp_elo', 'elo_diff', 'player_acc', 'opp_acc', 'acc_diff', 'color',
+        'x-ma5', 'x-ma20', 'opp_x-ma5', 'opp_x-ma20', 'won', 'num_reque', 'time_since_prev', 'prev_acc', 'prev_x-ma5', 'prev_x-ma20'
+    ]
+}
+
+SHARD_FORMATS = ('parquet', 'csv')
+
+
+## Feature rows
+def _opponentElos(archived_games, player_name, time_class, opp_filter_func, opp_window, opp_max_games):
+    """
+    For every game, the opponent's rating in each game of their history window ending with this game, oldest first,
+    as get_elo(opp_game, opp_name)['Player'] over get_games_between_timestamps(opp_name, end_time - opp_window, end_time).
+    Each opponent's history is loaded once for all the games played against them.
+    None for games whose opponent archive could not be retrieved, or in offline mode is not fully cached.
+    """
+    games_by_opponent = {}
+    for i, archived_game in enumerate(archived_games):
+        opp_name = archives_manager.get_opponent_name(archived_game, player_name)
+        games_by_opponent.setdefault(opp_name.lower(), (opp_name, []))[1].append(i)
+
+    opp_elos = [None] * len(archived_games)
+    for opp_name, game_indices in games_by_opponent.values():
+        end_times = np.array([archived_games[i]['end_time'] for i in game_indices], dtype=np.int64)
+
+        archives_manager.reset_offline_report()
+        try:
+            opp_history = archives_manager.load_player_history(
+                opp_name, int(end_times.min()) - opp_window, int(end_times.max()), time_class=time_class, filter_func=opp_filter_func
+            )
+        except archives_manager.ArchiveRetrievalError as e:
+            print("archive retrieval error", player_name, opp_name, e)
+            continue
+
+        # offline, a history with uncached months is partial, skip it as online mode would skip a missing archive
+        offline_report = archives_manager.get_offline_report()
+        if offline_report['missing_archive_lists'] or offline_report['missing_months']:
+            print("archive not cached", player_name, opp_name)
+            continue
+
+        for i, window_elos in zip(game_indices, opp_history.bulk_player_elo(end_times - opp_window, end_times, max_games=opp_max_games)):
+            opp_elos[i] = window_elos
+
+    return opp_elos
+
+def player_frame(player_name, start_unix, end_unix, time_class='rapid', filter_func=None, max_games=None,
+                 opp_filter_func=None, opp_window=30 * 24 * 60 * 60, opp_max_games=25,
+                 reque_gap=game_features.REQUE_GAP):
+    """
+    Build the feature rows of one player's games, as the dataset building notebooks do.
+
+    Games whose opponent archive cannot be retrieved (deleted accounts, mainly), or in offline mode is not fully
+    cached, are skipped and do not count towards the player's moving averages.
+
+    Parameters:
+    - player_name (str): The player's username on chess.com, written as is to the player_name column.
+    - start_unix (int): Window start, inclusive.
+    - end_unix (int): Window end, inclusive.
+    - time_class (string): The time class of the player's and opponents' games. Default 'rapid'.
+    - filter_func (function): Filter of the player's games. Default None.
+    - max_games (int): Only use the max_games most recent games of the window. Default None.
+    - opp_filter_func (function): Filter of the opponents' games. Default None.
+    - opp_window (int): Length in seconds of the opponent history window ending with each game. Default 30 days.
+    - opp_max_games (int): Only use the opp_max_games most recent games of each opponent window. Default 25.
+    - reque_gap (int): Longest time in seconds between two games of the same session, for num_reque. Default 1250.
+
+    Returns:
+    - pandas.DataFrame: One row per game, oldest first, with the columns of every feature set.
+    """
+    archived_games = archives_manager.get_games_between_timestamps(
+        player_name, start_unix, end_unix, time_class=time_class, filter_func=filter_func, max_games=max_games
+    )
+    opp_elos = _opponentElos(archived_games, player_name, time_class, opp_filter_func, opp_window, opp_max_games)
+
+    kept = [i for i, opp_recent_elo in enumerate(opp_elos) if opp_recent_elo is not None]
+    columns = archives_manager.get_game_columns([archived_games[i] for i in kept], player_name)
+    draw = columns['draw']
+
+    df = pd.DataFrame({
+        'unix': columns['end_time'],
+        'player_name': np.full(len(kept), player_name, dtype=object),
+        'opp_name': columns['opponent_name'],
+        'player_elo': columns['player_elo'],
+        'opp_elo': columns['opponent_elo'],
+        'elo_diff': columns['player_elo'] - columns['opponent_elo'],
+        'player_acc': columns['player_accuracy'],
+        'opp_acc': columns['opponent_accuracy'],
+        'acc_diff': columns['player_accuracy'] - columns['opponent_accuracy'],
+        'color': columns['is_white'],
+        # get_won is None for draws, which turns the notebooks' whole column into floats
+        'won': np.where(draw, np.nan, columns['won']) if draw.any() else columns['won'].astype(np.int64)
+    })
+    game_features.add_rolling_elo_features(df, [opp_elos[i] for i in kept], windows=(5, 20))
+
+    game_features.add_reque_features(df, gap=reque_gap, group_column='player_name')
+    df['prev_acc'] = game_features.group_shift(df['player_acc'], df['player_name'])
+
+    return df[FEATURE_SETS['combined']]
+
+
+## Shards
+def _shardPath(task):
+    # keyed on every build parameter, so a shard built with another window, filter or feature set is never reused
+    task_params = {key: value for key, value in task.items() if key != 'shard_dir'}
+    digest = hashlib.sha1(json.dumps(task_params, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(task['shard_dir'], f"{task['player_name'].lower()}.{digest}.{task['shard_format']}")
+
+def _writeFrame(df, file_path):
+    if file_path.endswith('.parquet'):
+        buffer = io.BytesIO()
+        df.to_parquet(buffer, index=False)
+        archive_store.write_file_atomic(file_path, buffer.getvalue())
+    else:
+        archive_store.write_file_atomic(file_path, df.to_csv(index=False))
+
+def _readShard(file_path):
+    if file_path.endswith('.parquet'):
+        return pd.read_parquet(file_path)
+    # usernames stay strings, e.g. '0123' or 'null', and floats parse back to the exact values written
+    return pd.read_csv(file_path, dtype={'player_name': str, 'opp_name': str}, keep_default_na=False, na_values=[''], float_precision='round_trip')
+
+def _initWorker(requests_per_sec, db_path, offline_mode):
+    archives_manager.set_rate_limit(requests_per_sec)
+    if db_path is not None:
+        archives_manager.set_archive_store(archive_store.SqliteArchiveStore(db_path))
+    archives_manager.configure(offline_mode=offline_mode)
+
+def build_shard(task):
+    """
+    Build and write the shard of one player unless a shard with the same parameters already exists.
+
+    Parameters:
+    - task (dict): Keyword arguments of player_frame plus 'feature_set', 'filter_spec', 'opp_filter_spec',
+      'shard_dir' and 'shard_format'. The filter specs hold build_archive_filter keyword arguments.
+
+    Returns:
+    - tuple: (player_name, shard path, number of rows or None if the shard already existed)
+    """
+    shard_path = _shardPath(task)
+    if os.path.isfile(shard_path):
+        return task['player_name'], shard_path, None
+
+    df = player_frame(
+        task['player_name'],
+        task['start_unix'],
+        task['end_unix'],
+        time_class=task['time_class'],
+        filter_func=archives_manager.build_archive_filter(**task['filter_spec']),
+        max_games=task['max_games'],
+        opp_filter_func=archives_manager.build_archive_filter(**task['opp_filter_spec']),
+        opp_window=task['opp_window'],
+        opp_max_games=task['opp_max_games'],
+        reque_gap=task['reque_gap']
+    )
+    df = df[FEATURE_SETS[task['feature_set']]]
+
+    _writeFrame(df, shard_path)
+    return task['player_name'], shard_path, len(df)
+
+def merge_shards(shard_paths, output_path):
+    """
+    Concatenate shards in order into one .csv or .parquet file.
+
+    Returns:
+    - pandas.DataFrame: The merged dataset.
+    """
+    df = pd.concat([_readShard(shard_path) for shard_path in shard_paths], ignore_index=True)
+    _writeFrame(df, output_path)
+    return df
+
+def build_dataset(player_names, start_unix, end_unix, output_path, feature_set='base', time_class='rapid',
+                  filter_spec=None, max_games=100, opp_filter_spec=None, opp_window=30 * 24 * 60 * 60, opp_max_games=25,
+                  reque_gap=game_features.REQUE_GAP, max_workers=None, shard_dir=None, shard_format='parquet', requests_per_sec=2.0, db_path=None,
+                  offline_mode=False, verbose=True):
+    """
+    Build a dataset with one worker process per player shard and merge the shards.
+
+    Parameters:
+    - player_names (list): Usernames on chess.com, the output keeps this order.
+    - start_unix (int): Window start of the players' games, inclusive.
+    - end_unix (int): Window end of the players' games, inclusive.
+    - output_path (str): The merged .csv or .parquet file.
+    - feature_set (str): A key of FEATURE_SETS. Default 'base'.
+    - time_class (string): The time class of the games. Default 'rapid'.
+    - filter_spec (dict): build_archive_filter keyword arguments for the players' games. Default rated, no draws, max_elo_diff 150.
+    - max_games (int): Only use each player's max_games most recent games of the window. Default 100.
+    - opp_filter_spec (dict): build_archive_filter keyword arguments for the opponents' games. Default rated, no draws.
+    - opp_window (int): Length in seconds of the opponent history window. Default 30 days.
+    - opp_max_games (int): Games per opponent window. Default 25.
+    - reque_gap (int): Longest time in seconds between two games of the same session, for num_reque. Default 1250.
+    - max_workers (int): Number of worker processes. Default os.cpu_count().
+    - shard_dir (str): Directory of the player shards. Default '<output_path>.shards'.
+    - shard_format (str): 'parquet' or 'csv'. Default 'parquet'.
+    - requests_per_sec (float): Rate limit to api.chess.com shared by all the workers. Default 2.0.
+    - db_path (str): Read and write the cache in this sqlite database instead of the json/ tree. Default None.
+    - offline_mode (bool): Only use cached archives. Default False.
+    - verbose (bool): Print progress. Default True.
+
+    Returns:
+    - pandas.DataFrame: The merged dataset.
+    """
+    if feature_set not in FEATURE_SETS:
+        raise ValueError(f"Unknown feature set '{feature_set}', expected one of {list(FEATURE_SETS)}")
+    if shard_format not in SHARD_FORMATS:
+        raise ValueError(f"Unknown shard format '{shard_format}', expected one of {list(SHARD_FORMATS)}")
+
+    max_workers = max_workers or os.cpu_count() or 1
+    shard_dir = shard_dir or output_path + '.shards'
+    os.makedirs(shard_dir, exist_ok=True)
+
+    tasks = [{
+        'player_name': player_name,
+        'start_unix': start_unix,
+        'end_unix': end_unix,
+        'time_class': time_class,
+        'filter_spec': {'rated': True, 'exclude_draws': True, 'max_elo_diff': 150} if filter_spec is None else filter_spec,
+        'max_games': max_games,
+        'opp_filter_spec': {'rated': True, 'exclude_draws': True} if opp_filter_spec is None else opp_filter_spec,
+        'opp_window': opp_window,
+        'opp_max_games': opp_max_games,
+        'reque_gap': reque_gap,
+        'feature_set': feature_set,
+        'shard_dir': shard_dir,
+        'shard_format': shard_format
+    } for player_name in player_names]
+
+    started = time.time()
+    shard_paths = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_initWorker, initargs=(requests_per_sec / max_workers, db_path, offline_mode)) as executor:
+        for player_name, shard_path, num_rows in executor.map(build_shard, tasks):
+            shard_paths[player_name] = shard_path
+            if verbose:
+                status = 'existing shard' if num_rows is None else f'{num_rows} rows'
+                print(f"{len(shard_paths)}/{len(tasks)} {player_name}: {status} ({time.time() - started:.1f}s)")
+
+    df = merge_shards([shard_paths[player_name] for player_name in player_names], output_path)
+    if verbose:
+        print(f"Wrote {len(df)} rows to {output_path}")
+    return df
+
+
+def _optionalInt(value):
+    return None if value.lower() == 'none' else int(value)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build a training dataset from the chess.com archives of a list of players.')
+    players_group = parser.add_mutually_exclusive_group(required=True)
+    players_group.add_argument('--players', nargs='+')
+    players_group.add_argument('--players-file', help='file with one username per line')
+    parser.add_argument('--start', type=int, required=True, help='window start, unix seconds')
+    parser.add_argument('--end', type=int, required=True, help='window end, unix seconds')
+    parser.add_argument('--out', required=True, help='merged .csv or .parquet file')
+    parser.add_argument('--features', choices=sorted(FEATURE_SETS), default='base')
+    parser.add_argument('--time-class', default='rapid')
+
+    parser.add_argument('--include-unrated', action='store_true')
+    parser.add_argument('--include-draws', action='store_true')
+    parser.add_argument('--max-elo-diff', type=_optionalInt, default=150, help="'none' for no limit")
+    parser.add_argument('--max-games', type=_optionalInt, default=100, help="'none' for every game of the window")
+
+    parser.add_argument('--opp-include-unrated', action='store_true')
+    parser.add_argument('--opp-include-draws', action='store_true')
+    parser.add_argument('--opp-window-days', type=float, default=30)
+    parser.add_argument('--opp-max-games', type=_optionalInt, default=25)
+    parser.add_argument('--reque-gap', type=int, default=game_features.REQUE_GAP, help='seconds between games of the same session')
+
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--shard-dir', default=None)
+    parser.add_argument('--shard-format', choices=SHARD_FORMATS, default='parquet')
+    parser.add_argument('--requests-per-sec', type=float, default=2.0)
+    parser.add_argument('--db', default=None, help='sqlite archive store instead of the json/ tree')
+    parser.add_argument('--offline', action='store_true')
+
+    args = parser.parse_args()
+
+    if args.players_file is not None:
+        with open(args.players_file, 'r') as players_file:
+            player_names = [line.strip() for line in players_file if line.strip()]
+    else:
+        player_names = args.players
+
+    build_dataset(
+        player_names,
+        args.start,
+        args.end,
+        args.out,
+        feature_set=args.features,
+        time_class=args.time_class,
+        filter_spec={'rated': None if args.include_unrated else True, 'exclude_draws': None if args.include_draws else True, 'max_elo_diff': args.max_elo_diff},
+        max_games=args.max_games,
+        opp_filter_spec={'rated': None if args.opp_include_unrated else True, 'exclude_draws': None if args.opp_include_draws else True},
+        opp_window=int(args.opp_window_days * 24 * 60 * 60),
+        opp_max_games=args.opp_max_games,
+        reque_gap=args.reque_gap,
+        max_workers=args.workers,
+        shard_dir=args.shard_dir,
+        shard_format=args.shard_format,
+        requests_per_sec=args.requests_per_sec,
+        db_path=args.db,
+        offline_mode=args.offline
+    )
@@ -0,0 +1,203 @@
+# game_features.py
+# Vectorized versions of the per-game features of the dataset building notebooks
+#
+# The notebooks recompute every moving average from a python list slice on each game. Here every feature
+# is computed for a whole frame of games at once, for any number of players: rows of the same player
+# must be contiguous and oldest first, as dataset_builder writes them.
+#
+# Moving averages come from integer cumulative sums, so a window of any size costs one subtraction per row,
+# and every value is bit for bit the float the notebooks computed with sum(...) / window.
+#
+# Usage:
+# df = game_features.add_rolling_elo_features(df, opp_window_elos, windows=(5, 20, 50))
+# opp_history_df = game_features.add_reque_features(opp_history_df, group_column='reference_index')
+
+import numpy as np
+
+
+# x-ma<window> is the player's rating minus their moving average, except x-ma20 in the notebooks (and the
+# datasets the models were trained on) subtracts the player's 20 game average from the opponent's rating
+X_MA_REFERENCE = {20: 'opp_elo'}
+
+# a game starting within this many seconds of the end of the previous one is a reque
+REQUE_GAP = 1250
+
+
+## Groups
+def group_starts(group_keys):
+    """
+    True at the first row of every group of contiguous equal keys.
+    """
+    group_keys = np.asarray(group_keys)
+    starts = np.ones(len(group_keys), dtype=bool)
+    if len(group_keys) > 1:
+        starts[1:] = group_keys[1:] != group_keys[:-1]
+    return starts
+
+def group_positions(group_keys):
+    """
+    Position of every row in its group of contiguous equal keys, 0 for the first row.
+    """
+    starts = group_starts(group_keys)
+    rows = np.arange(len(starts))
+    return rows - np.maximum.accumulate(np.where(starts, rows, 0))
+
+def group_shift(values, group_keys, fill_value=np.nan):
+    """
+    The previous row's value within each group, like groupby(...).shift(1), fill_value on the first row of a group.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    shifted = np.empty(len(values), dtype=np.float64)
+    shifted[1:] = values[:-1]
+    shifted[group_starts(group_keys)] = fill_value
+    return shifted
+
+
+## Moving averages
+def rolling_mean(values, window, group_keys=None):
+    """
+    Mean of the last window values up to and including each row, within its group.
+
+    Parameters:
+    - values (array-like): Integer values in row order, e.g. ratings.
+    - window (int): Number of values averaged.
+    - group_keys (array-like): Contiguous group key of every row, e.g. player names. Default None, a single group.
+
+    Returns:
+    - numpy.ndarray: float64 means, nan where the group has fewer than window values so far.
+    """
+    values = np.asarray(values, dtype=np.int64)
+    means = np.full(len(values), np.nan)
+
+    positions = np.arange(len(values)) if group_keys is None else group_positions(group_keys)
+    rows = np.flatnonzero(positions >= window - 1)
+
+    cumulative = np.concatenate(([0], np.cumsum(values)))
+    means[rows] = (cumulative[rows + 1] - cumulative[rows + 1 - window]) / window
+    return means
+
+def _cumulativeWindows(windows):
+    # running sum over all the arrays laid end to end, and where each array ends in it
+    lengths = np.array([len(values) for values in windows], dtype=np.int64)
+    flat = np.concatenate([np.asarray(values, dtype=np.int64) for values in windows] + [np.empty(0, dtype=np.int64)])
+    return np.concatenate(([0], np.cumsum(flat))), np.cumsum(lengths), lengths
+
+def _tailMeans(cumulative_windows, window):
+    cumulative, ends, lengths = cumulative_windows
+    means = np.full(len(lengths), np.nan)
+    rows = np.flatnonzero(lengths >= window)
+    means[rows] = (cumulative[ends[rows]] - cumulative[ends[rows] - window]) / window
+    return means
+
+def window_tail_means(windows, window):
+    """
+    Mean of the last window values of every array in a list, e.g. the opponent's ratings in each game's history window.
+
+    Parameters:
+    - windows (list): Integer arrays, one per row.
+    - window (int): Number of trailing values averaged.
+
+    Returns:
+    - numpy.ndarray: float64 means, nan where the array has fewer than window values.
+    """
+    return _tailMeans(_cumulativeWindows(windows), window)
+
+
+## Elo features
+def add_rolling_elo_features(df, opp_window_elos=None, windows=(5, 20), group_column='player_name', reference_columns=None):
+    """
+    Add the moving average Elo features of the dataset building notebooks to a frame of games:
+    - x-ma<w>: player_elo (opp_elo for w=20, see X_MA_REFERENCE) minus the mean of the player's last w ratings, this game included.
+    - prev_x-ma<w>: x-ma<w> of the player's previous game.
+    - opp_x-ma<w>: opp_elo minus the mean of the opponent's last w ratings in opp_window_elos.
+    Each is nan where fewer than w ratings are available.
+
+    Parameters:
+    - df (pandas.DataFrame): Games with 'player_elo', 'opp_elo' and group_column, contiguous per player and oldest first.
+    - opp_window_elos (list): For every row, the opponent's ratings over their recent games ending with this one, oldest first,
+      e.g. from PlayerHistory.bulk_player_elo. Default None, no opp_x-ma columns.
+    - windows (tuple): Moving average sizes. Default (5, 20).
+    - group_column (str): Column identifying the player. Default 'player_name'.
+    - reference_columns (dict): window -> column the average is subtracted from, player_elo otherwise. Default X_MA_REFERENCE.
+
+    Returns:
+    - pandas.DataFrame: df, with the columns added.
+    """
+    reference_columns = X_MA_REFERENCE if reference_columns is None else reference_columns
+    group_keys = df[group_column].to_numpy()
+    player_elo = df['player_elo'].to_numpy(dtype=np.int64)
+    opp_elo = df['opp_elo'].to_numpy(dtype=np.int64)
+    cumulative_opp_elos = None if opp_window_elos is None else _cumulativeWindows(opp_window_elos)
+
+    for window in windows:
+        reference = df[reference_columns.get(window, 'player_elo')].to_numpy(dtype=np.int64)
+        x_ma = reference - rolling_mean(player_elo, window, group_keys)
+        df[f'x-ma{window}'] = x_ma
+        df[f'prev_x-ma{window}'] = group_shift(x_ma, group_keys)
+
+        if cumulative_opp_elos is not None:
+            df[f'opp_x-ma{window}'] = opp_elo - _tailMeans(cumulative_opp_elos, window)
+
+    return df
+
+
+## Reque features
+def reque_features(end_times, gap=REQUE_GAP, group_keys=None):
+    """
+    Session features of games in row order, like the iterrows loops of tyler_reque.ipynb.
+    A session starts at the first game of a group and at every game more than gap seconds after the previous one.
+
+    Parameters:
+    - end_times (array-like): Game end timestamps, oldest first within each group.
+    - gap (int): Longest time in seconds between two games of the same session. Default REQUE_GAP.
+    - group_keys (array-like): Contiguous group key of every row, e.g. player names. Default None, a single group.
+
+    Returns:
+    - dict: {
+        'time_since_prev': int64 seconds since the previous game of the group, 0 for the first one.
+        'session_id': int64 session number, unique across groups.
+        'num_reque': int64 number of games before this one in its session.
+    }
+    """
+    end_times = np.asarray(end_times, dtype=np.int64)
+    if group_keys is None:
+        starts = np.zeros(len(end_times), dtype=bool)
+        starts[:1] = True
+    else:
+        starts = group_starts(group_keys)
+
+    time_since_prev = np.zeros(len(end_times), dtype=np.int64)
+    time_since_prev[1:] = np.diff(end_times)
+    time_since_prev[starts] = 0
+
+    session_breaks = starts | (time_since_prev > gap)
+    session_id = np.cumsum(session_breaks) - 1
+
+    rows = np.arange(len(end_times))
+    num_reque = rows - np.maximum.accumulate(np.where(session_breaks, rows, 0))
+
+    return {
+        'time_since_prev': time_since_prev,
+        'session_id': session_id,
+        'num_reque': num_reque
+    }
+
+def add_reque_features(df, gap=REQUE_GAP, time_column='unix', group_column=None, prefix=''):
+    """
+    Add the num_reque, time_since_prev and session_id columns of reque_features to a frame of games.
+
+    Parameters:
+    - df (pandas.DataFrame): Games, contiguous per group and oldest first.
+    - gap (int): Longest time in seconds between two games of the same session. Default REQUE_GAP.
+    - time_column (str): Column of game end timestamps. Default 'unix'.
+    - group_column (str): Column identifying the player, e.g. 'player_name', or 'reference_index' for the
+      opponent histories of opp_24h.csv. Default None, a single player.
+    - prefix (str): Prepended to the added column names, e.g. 'opp_'. Default ''.
+
+    Returns:
+    - pandas.DataFrame: df, with the columns added.
+    """
+    group_keys = None if group_column is None else df[group_column].to_numpy()
+    for name, column in reque_features(df[time_column].to_numpy(), gap, group_keys).items():
+        df[prefix + name] = column
+    return df
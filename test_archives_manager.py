@@ -0,0 +1,231 @@
+# test_archives_manager.py
+# Tests the concurrent fetch mode of archives_manager against a local stub of the api.chess.com endpoints
+#
+# Run with:
+#   python -m unittest test_archives_manager
+
+import calendar
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import archive_store
+import archives_manager
+
+
+PLAYER = 'stubplayer'
+MONTHS = [(2023, month) for month in range(1, 9)]
+GAMES_PER_MONTH = 5
+
+
+def _stubGame(player_name, end_time, i):
+    player_is_white = i % 2 == 0
+    player = {'username': player_name, 'rating': 1200 + i, 'result': 'win'}
+    opponent = {'username': 'opponent', 'rating': 1200 - i, 'result': 'resigned'}
+    return {
+        'url': f'https://www.chess.com/game/live/{end_time}',
+        'uuid': f'{end_time}-{i}',
+        'end_time': end_time,
+        'rated': True,
+        'time_class': 'rapid',
+        'rules': 'chess',
+        'time_control': '600',
+        'white': player if player_is_white else opponent,
+        'black': opponent if player_is_white else player
+    }
+
+
+class _StubApi:
+    """
+    Serves /pub/player/<player>/games/archives and /pub/player/<player>/games/<yyyy>/<mm> from memory,
+    recording when every request arrived and how many were in flight at once.
+    """
+
+    def __init__(self, response_delay=0.0):
+        self.months = {}
+        self.response_delay = response_delay
+        self.rate_limited_paths = set()
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub._handle(self)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}/pub'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def add_month(self, player_name, year, month, num_games):
+        start = calendar.timegm((year, month, 1, 0, 0, 0))
+        self.months[(player_name, f'{year}', f'{month:02d}')] = [_stubGame(player_name, start + 3600 * i, i) for i in range(num_games)]
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _handle(self, request):
+        with self._lock:
+            self.requests.append((time.monotonic(), request.path))
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            rate_limited = request.path in self.rate_limited_paths
+            self.rate_limited_paths.discard(request.path)
+
+        try:
+            time.sleep(self.response_delay)
+
+            if rate_limited:
+                request.send_response(429)
+                request.send_header('Retry-After', '0')
+                request.end_headers()
+                return
+
+            body = self._body(request.path)
+            if body is None:
+                request.send_response(404)
+                request.end_headers()
+                return
+
+            request.send_response(200)
+            request.send_header('Content-Type', 'application/json')
+            request.send_header('Content-Length', str(len(body)))
+            request.end_headers()
+            request.wfile.write(body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _body(self, path):
+        match = re.match(r'/pub/player/([^/]+)/games/archives$', path)
+        if match:
+            urls = sorted(f'{self.base_url}/player/{player}/games/{year}/{month}' for player, year, month in self.months if player == match.group(1))
+            return json.dumps({'archives': urls}).encode('utf-8')
+
+        match = re.match(r'/pub/player/([^/]+)/games/(\d{4})/(\d{2})$', path)
+        if match and match.groups() in self.months:
+            return json.dumps({'games': self.months[match.groups()]}).encode('utf-8')
+        return None
+
+    def month_requests(self):
+        return [(requested_at, path) for requested_at, path in self.requests if not path.endswith('/archives')]
+
+
+class ConcurrentFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stub = _StubApi()
+        for year, month in MONTHS:
+            self.stub.add_month(PLAYER, year, month, GAMES_PER_MONTH)
+
+        self.temp_dir = tempfile.mkdtemp()
+        self.saved = (
+            archives_manager.api_base_url, archives_manager.rate_limiter, archives_manager.store, archives_manager.backoff_factor,
+            archives_manager.user_agent, archives_manager.session
+        )
+
+        archives_manager.api_base_url = self.stub.base_url
+        archives_manager.backoff_factor = 0.01
+        archives_manager.configure(
+            user_agent_info={'username': 'test', 'email': 'test@example.com'},
+            archive_store_backend=archive_store.JsonArchiveStore(os.path.join(self.temp_dir, 'json'))
+        )
+        archives_manager.set_rate_limit(1000, burst=100)
+        archives_manager.reset_transfer_stats()
+
+    def tearDown(self):
+        api_base_url, rate_limiter, store, backoff_factor, user_agent, session = self.saved
+        archives_manager.api_base_url = api_base_url
+        archives_manager.rate_limiter = rate_limiter
+        archives_manager.backoff_factor = backoff_factor
+        archives_manager.user_agent = user_agent
+        archives_manager.session = session
+
+        # put the previous store back as it was, set_archive_store would initialize it in the working directory
+        archives_manager.store = store
+        archives_manager._cache_index = None
+        archives_manager.month_cache.clear()
+        archives_manager._month_meta.clear()
+        with archives_manager._month_index_lock:
+            archives_manager._month_indexes.clear()
+        self.stub.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_prefetch_downloads_months_concurrently(self):
+        self.stub.response_delay = 0.2
+
+        started = time.monotonic()
+        games = archives_manager.get_games_between_timestamps(PLAYER, 0, 2**31, prefetch=True, max_workers=4)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(len(games), len(MONTHS) * GAMES_PER_MONTH)
+        self.assertEqual(len(self.stub.month_requests()), len(MONTHS))
+        self.assertGreaterEqual(self.stub.max_in_flight, 3)
+        # 8 months one after the other would take 1.6 seconds
+        self.assertLess(elapsed, 1.2)
+
+    def test_cached_months_are_not_prefetched_again(self):
+        archives_manager.get_games_between_timestamps(PLAYER, 0, 2**31, prefetch=True)
+        num_requests = len(self.stub.requests)
+
+        archives_manager.get_games_between_timestamps(PLAYER, 0, 2**31, prefetch=True)
+        self.assertEqual(len(self.stub.requests), num_requests)
+
+    def test_most_recent_games_prefetch(self):
+        games = archives_manager.get_most_recent_games(PLAYER, num_games=12, prefetch_months=3, max_workers=3)
+
+        self.assertEqual(len(games), 12)
+        self.assertEqual([game['end_time'] for game in games], sorted(game['end_time'] for game in games))
+        self.assertLessEqual(len(self.stub.month_requests()), 6)
+
+    def test_token_bucket_paces_requests(self):
+        archives_manager.set_rate_limit(10, burst=1)
+
+        archives_manager.prefetch_archived_games(archives_manager._getMonthlyArchivesList(PLAYER), max_workers=8)
+
+        request_times = sorted(requested_at for requested_at, _ in self.stub.requests)
+        self.assertEqual(len(request_times), len(MONTHS) + 1)
+        # 9 requests at 10 per second with no burst are spread over at least 0.8 seconds, whatever the number of workers
+        self.assertGreaterEqual(request_times[-1] - request_times[0], 0.7)
+        gaps = [later - earlier for earlier, later in zip(request_times, request_times[1:])]
+        self.assertGreaterEqual(min(gaps), 0.05)
+
+    def test_token_bucket_burst(self):
+        bucket = archives_manager._TokenBucket(rate=20, burst=3)
+
+        started = time.monotonic()
+        for _ in range(3):
+            bucket.acquire()
+        self.assertLess(time.monotonic() - started, 0.04)
+
+        for _ in range(4):
+            bucket.acquire()
+        self.assertGreaterEqual(time.monotonic() - started, 0.18)
+
+    def test_rate_limited_request_is_retried(self):
+        year, month = MONTHS[0]
+        month_path = f'/pub/player/{PLAYER}/games/{year}/{month:02d}'
+        self.stub.rate_limited_paths.add(month_path)
+
+        archives_manager.prefetch_archived_games([self.stub.base_url + month_path[len('/pub'):]])
+
+        self.assertEqual([path for _, path in self.stub.requests], [month_path, month_path])
+        self.assertEqual(archives_manager.get_transfer_stats()['retries'], 1)
+        games = archives_manager.get_games_between_timestamps(PLAYER, 0, calendar.timegm((year, month + 1, 1, 0, 0, 0)) - 1)
+        self.assertEqual(len(games), GAMES_PER_MONTH)
+
+
+if __name__ == '__main__':
+    unittest.main()